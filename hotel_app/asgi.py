@@ -0,0 +1,20 @@
+"""
+ASGI config for hotel_app project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The free room search, the booking list and booking creation are served by async handlers,
+other requests by the WSGI application, see reservations/asgi.py.
+Run it with any ASGI server, e.g. uvicorn hotel_app.asgi:application
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hotel_app.settings")
+
+wsgi_application = get_wsgi_application()
+
+from reservations.asgi import ASGIApplication
+
+application = ASGIApplication(wsgi_application)
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'reservations.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,10 +80,49 @@ WSGI_APPLICATION = 'hotel_app.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get('SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+        # seconds a connection waits for another one to release the write lock before failing with "database is locked"
+        'OPTIONS': {'timeout': 20},
     }
 }
 
+# Pragmas set on every new SQLite connection are listed in DEFAULT_PRAGMAS of reservations/database.py.
+# Set SQLITE_PRAGMAS to a dict of the ones to change or add, e.g. {'synchronous': 'FULL'}.
+
+# Set SQLITE_WRITE_QUEUE to let booking writes of a process go one at a time instead of competing for the write lock.
+# At most SQLITE_WRITE_QUEUE_SIZE writes wait, each up to SQLITE_WRITE_QUEUE_TIMEOUT seconds, others get 503 responses.
+SQLITE_WRITE_QUEUE = bool(os.environ.get('SQLITE_WRITE_QUEUE'))
+SQLITE_WRITE_QUEUE_SIZE = 32
+SQLITE_WRITE_QUEUE_TIMEOUT = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# Local memory is private to every worker process, set CACHE_DIR to share the cache between gunicorn workers through files.
+# Every cached booking takes two entries, its version and its data, next to responses of room and category views.
+# MAX_ENTRIES (CACHE_MAX_ENTRIES) should cover twice the number of bookings polled, a tenth of entries is culled when it's reached.
+
+CACHE_OPTIONS = {
+    'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 100000)),
+    'CULL_FREQUENCY': 10,
+}
+
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -128,9 +168,54 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 200,
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'reservations.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]
 }
 
+# Reservations app settings
+
+# Maximum age in seconds of the in-memory room availability index used by the free room search.
+# Bookings written by other worker processes become visible after at most this long.
+ROOM_INDEX_TTL = 60
+
+# Maximum age in seconds of the in-memory room category price table, after which prices changed
+# by other worker processes are reloaded. Use None to keep prices until a category is written.
+CATEGORY_PRICE_TTL = 300
+
+# Maximum age in seconds of responses of the room and room category views kept in the cache.
+# Cached responses are dropped earlier whenever a room or a category is written.
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Maximum age in seconds of serialized bookings kept in the cache for booking details, costs and durations.
+# Cached bookings are dropped earlier whenever they or their room bookings are saved or deleted, including through the admin.
+# Writes bypassing model signals, like QuerySet.update or bulk_create, are not noticed.
+BOOKING_CACHE_TIMEOUT = 300
+
+# Maximum number of nights of a booked stay. Every night is written as a row of room nights and daily stats
+# under the database write lock, so longer stays are rejected with 400 responses. Use None to allow stays of any length.
+MAX_STAY_NIGHTS = 365
+
+# Maximum number of days of a date range of the occupancy and revenue reports, which have a row for every day
+# of the range, or every category and day, before grouping. Longer ranges are rejected with 400 responses.
+# Use None to allow ranges of any length.
+MAX_STATS_DAYS = 1830
+
+# Number of latest requests of every view whose measurements are kept for percentiles served at /api/metrics/.
+METRICS_WINDOW = 1000
+
+# Queries of a request taking at least this many milliseconds are logged, up to METRICS_SLOW_QUERY_LIMIT slowest ones.
+# Use None to turn logging of slow queries off.
+METRICS_SLOW_QUERY_MS = 100
+METRICS_SLOW_QUERY_LIMIT = 5
+
+# Number of threads running database work of requests served by the ASGI application (hotel_app/asgi.py),
+# and number of requests that may wait for one of them before further ones get 503 responses.
+ASGI_DB_THREADS = 8
+ASGI_MAX_PENDING = 1000
+
 # Configure Django App for Heroku.
 import django_heroku
 django_heroku.settings(locals())
\ No newline at end of file
@@ -0,0 +1,239 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import logging
+import sys
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.http import QueryDict
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+
+logger = logging.getLogger('django.request')
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class DatabasePool:
+    """
+    Bounded pool of threads running database work of async handlers.
+    At most ASGI_DB_THREADS jobs run at once and up to ASGI_MAX_PENDING more wait for a thread,
+    further jobs are refused right away, so that a flood of clients gets 503 responses instead of piling up work.
+    """
+    def __init__(self, threads, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.capacity = threads + max_pending
+        self.jobs = 0
+
+    async def run(self, function, *args):
+        if self.jobs >= self.capacity:
+            raise ServerBusy()
+        self.jobs += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, self.run_job, function, args)
+        finally:
+            self.jobs -= 1
+
+    def run_job(self, function, args):
+        # connections of pool threads are reused or closed like the ones of request threads
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+
+
+def build_environ(scope, body):
+    """
+    Returns a WSGI environ of an ASGI HTTP request
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': unquote(scope['path']),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def render(data, status_code):
+    return status_code, JSONRenderer().render(data)
+
+
+def check_availability(start_date, end_date, number_of_people, category, limit):
+    from reservations.views import find_available_rooms
+    return render(find_available_rooms(start_date, end_date, number_of_people, category, limit), 200)
+
+
+def list_bookings(request):
+    """
+    Returns a page of bookings filtered and paginated the same way as by the booking list view
+    """
+    from reservations.views import BookingList
+    from reservations.serializers import BookingSerializer
+    booking_filter = BookingList.filterset_class(request.query_params, queryset=BookingList.queryset.all(), request=request)
+    if not booking_filter.is_valid():
+        return render(booking_filter.errors, 400)
+    paginator = BookingList.pagination_class()
+    page = paginator.paginate_queryset(booking_filter.qs, request)
+    return render(paginator.get_paginated_response(BookingSerializer(page, many=True).data).data, 200)
+
+
+def create_booking(data):
+    from reservations.views import save_booking
+    response = save_booking(data)
+    return render(response.data, response.status_code)
+
+
+class ASGIApplication:
+    """
+    ASGI application serving the free room search, the booking list and booking creation with async handlers.
+    Handlers read requests and write responses on the event loop and send all database work of a request
+    to the database pool as a single job, so slow clients only hold a coroutine, not a thread.
+    Other requests are passed to the WSGI application in the same pool.
+    Async handlers skip Django middleware, their responses are the same JSON as the ones of the views.
+    """
+    def __init__(self, wsgi_application, threads=None, max_pending=None):
+        self.wsgi_application = wsgi_application
+        self.pool = DatabasePool(
+            threads or getattr(settings, 'ASGI_DB_THREADS', 8),
+            max_pending if max_pending is not None else getattr(settings, 'ASGI_MAX_PENDING', 1000)
+        )
+        self.routes = {
+            ('GET', '/api/room/available/'): self.room_availability,
+            ('GET', '/api/booking/'): self.booking_list,
+            ('POST', '/api/booking/'): self.booking_create,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError("Unsupported scope type: " + scope['type'])
+
+        body = await self.read_body(receive)
+        handler = self.routes.get((scope['method'], scope['path']), self.wsgi)
+        try:
+            status_code, headers, content = await handler(scope, body)
+        except ServerBusy:
+            status_code, headers, content = self.json_response(503, b'"Server is busy, please try again"')
+        except Exception:
+            logger.exception("Internal Server Error: %s", scope['path'])
+            status_code, headers, content = self.json_response(500, b'"Server error"')
+        await send({'type': 'http.response.start', 'status': status_code, 'headers': headers})
+        if isinstance(content, bytes):
+            await send({'type': 'http.response.body', 'body': content})
+        else:
+            # streamed response of the WSGI application, chunks are read in the pool
+            try:
+                while True:
+                    chunk = await self.pool.run(next, content, None)
+                    if chunk is None:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(content, 'close'):
+                    await self.pool.run(content.close)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    def json_response(self, status_code, content):
+        return status_code, [(b'content-type', b'application/json')], content
+
+    async def room_availability(self, scope, body):
+        from reservations.views import parse_availability_params
+        params = QueryDict(scope.get('query_string', b''))
+        try:
+            params = parse_availability_params(params)
+        except ValueError as err:
+            return self.json_response(*render(str(err), 400))
+        return self.json_response(*await self.pool.run(check_availability, *params))
+
+    async def booking_list(self, scope, body):
+        request = Request(WSGIRequest(build_environ(scope, body)))
+        return self.json_response(*await self.pool.run(list_bookings, request))
+
+    async def booking_create(self, scope, body):
+        headers = dict(scope.get('headers', []))
+        content_type = headers.get(b'content-type', b'').decode('latin-1')
+        try:
+            if content_type.startswith('application/json'):
+                data = json.loads(body.decode('utf-8'))
+            elif content_type.startswith('application/x-www-form-urlencoded'):
+                data = QueryDict(body, encoding='utf-8').dict()
+            else:
+                # multipart forms and other bodies are parsed by the booking list view
+                return await self.wsgi(scope, body)
+        except ValueError as err:
+            return self.json_response(*render("Incorrect request body: " + str(err), 400))
+        if not isinstance(data, dict):
+            return self.json_response(*render("Incorrect request body: expected an object", 400))
+        return self.json_response(*await self.pool.run(create_booking, data))
+
+    async def wsgi(self, scope, body):
+        return await self.pool.run(self.call_wsgi, build_environ(scope, body))
+
+    def call_wsgi(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        content = self.wsgi_application(environ, start_response)
+        if getattr(content, 'streaming', False):
+            return response['status'], response['headers'], iter(content)
+        try:
+            return response['status'], response['headers'], b''.join(content)
+        finally:
+            # lets Django send request_finished, closing database connections of the thread
+            if hasattr(content, 'close'):
+                content.close()
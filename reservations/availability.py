@@ -0,0 +1,131 @@
+from bisect import bisect_left
+from datetime import datetime
+from decimal import Decimal
+import threading
+import time
+
+from django.conf import settings
+
+from reservations.models import RoomBooking
+
+
+class RoomIntervalIndex:
+    """
+    Per-room index of booked [start_date, end_date) intervals.
+    Intervals of every room are kept sorted by start date together with a running maximum of end dates,
+    so checking a room for a conflict takes a single bisection.
+    """
+    def __init__(self, intervals):
+        by_room = {}
+        for room_id, start_date, end_date in intervals:
+            by_room.setdefault(room_id, []).append((start_date, end_date))
+
+        self.starts = {}
+        self.max_ends = {}
+        for room_id, room_intervals in by_room.items():
+            room_intervals.sort()
+            starts = []
+            max_ends = []
+            max_end = None
+            for start_date, end_date in room_intervals:
+                max_end = end_date if max_end is None or end_date > max_end else max_end
+                starts.append(start_date)
+                max_ends.append(max_end)
+            self.starts[room_id] = starts
+            self.max_ends[room_id] = max_ends
+
+    def is_available(self, room_id, start_date, end_date):
+        """
+        Checks if the room is free within the [start_date, end_date) period
+        """
+        starts = self.starts.get(room_id)
+        if not starts:
+            return True
+        # intervals starting before end_date are the only candidates, the latest ending one decides
+        position = bisect_left(starts, end_date)
+        return position == 0 or self.max_ends[room_id][position - 1] <= start_date
+
+    def free_rooms(self, rooms, start_date, end_date):
+        """
+        Returns rooms from the list that are free within the [start_date, end_date) period
+        """
+        return [room for room in rooms if self.is_available(room.id, start_date, end_date)]
+
+
+_index_lock = threading.Lock()
+_index = None
+_index_built_at = 0
+
+
+def build_room_index():
+    """
+    Builds the index from bookings that have not ended yet, past stays can never conflict with a new one
+    """
+    today = datetime.today().date()
+    intervals = RoomBooking.objects.filter(booking__end_date__gt=today).values_list('room_id', 'booking__start_date', 'booking__end_date')
+    return RoomIntervalIndex(intervals.iterator())
+
+
+def get_room_index():
+    """
+    Returns a process-wide index, rebuilding it when invalidated or older than ROOM_INDEX_TTL seconds.
+    The TTL bounds how long a worker can miss bookings written by other processes.
+    """
+    global _index, _index_built_at
+    ttl = getattr(settings, 'ROOM_INDEX_TTL', 60)
+    with _index_lock:
+        if _index is None or (ttl is not None and time.monotonic() - _index_built_at > ttl):
+            _index = build_room_index()
+            _index_built_at = time.monotonic()
+        return _index
+
+
+def invalidate_room_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def cheapest_combinations(rooms, people, nights, limit=3):
+    """
+    Returns up to `limit` cheapest sets of rooms with a total capacity of at least `people`.
+    Rooms of the same category and capacity are interchangeable, so the search runs over room types
+    and only as many rooms of a type as could possibly be needed are considered.
+    """
+    people = int(people)
+    if people > sum(room.capacity for room in rooms):
+        # no set of the rooms is big enough, there's nothing to search for
+        return []
+    room_types = {}
+    for room in sorted(rooms, key=lambda room: room.number):
+        if room.capacity > 0:
+            room_types.setdefault((room.category_id, room.capacity), []).append(room)
+    room_types = list(room_types.values())
+
+    # states[capacity] holds the cheapest (cost, counts) pairs reaching a capped capacity
+    states = {0: [(Decimal(0), ())]}
+    for type_rooms in room_types:
+        capacity = type_rooms[0].capacity
+        price = type_rooms[0].get_cost()
+        max_count = min(len(type_rooms), -(-people // capacity))
+        new_states = {}
+        for reached, options in states.items():
+            for count in range(max_count + 1):
+                new_reached = min(people, reached + count * capacity)
+                new_options = new_states.setdefault(new_reached, [])
+                for cost, counts in options:
+                    new_options.append((cost + price * count, counts + (count,)))
+        states = {reached: sorted(options, key=lambda option: option[0])[:limit] for reached, options in new_states.items()}
+
+    combinations = []
+    for cost, counts in states.get(people, []):
+        selected = [room for type_rooms, count in zip(room_types, counts) for room in type_rooms[:count]]
+        if not selected:
+            continue
+        combinations.append({
+            "room_ids": [room.id for room in selected],
+            "room_numbers": [room.number for room in selected],
+            "capacity": sum(room.capacity for room in selected),
+            "cost": cost * nights
+        })
+    return combinations
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+import json
+import platform
+import random
+import subprocess
+import time
+
+import django
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+
+from reservations.models import Room, RoomCategory, Booking
+from reservations.serializers import BookingSerializer
+from reservations.parsing import BookingRequest
+
+
+def percentile(values, fraction):
+    """
+    Returns a percentile of sorted values, interpolating between the closest ranks
+    """
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(timings, errors, elapsed):
+    """
+    Returns throughput and latency percentiles in milliseconds of operations timed in seconds
+    """
+    timings = sorted(timings)
+    return {
+        'operations': len(timings),
+        'errors': errors,
+        'throughput_per_s': round(len(timings) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3) if timings else None,
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3) if timings else None,
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3) if timings else None,
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3) if timings else None,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BookingBenchmark:
+    """
+    Measures booking creation, update, the filtered booking list, the free room search, serialization of a page of bookings
+    and parsing of a booking payload on the current database, going through the whole request stack with the test client
+    except for serialization and parsing.
+    All writes are rolled back at the end, so runs on the same dataset are comparable.
+    """
+    cases = ['booking_create', 'booking_update', 'booking_list', 'availability', 'serialization', 'parsing']
+
+    def __init__(self, iterations=200, warmup=10, seed=None):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.random = random.Random(seed)
+        self.client = Client()
+
+    def run(self, cases=None, log=None):
+        rooms = list(Room.objects.order_by('id'))
+        if not rooms:
+            raise ValueError("There are no rooms, fill the database with the seed_hotel command first")
+        self.rooms = rooms
+        self.category_ids = list(RoomCategory.objects.values_list('id', flat=True))
+        self.today = datetime.today().date()
+        last_end_date = Booking.objects.aggregate(end_date=Max('end_date'))['end_date'] or self.today
+        self.horizon = max((last_end_date - self.today).days, 1)
+        # bookings made by the benchmark start after all existing ones, so that they never conflict
+        self.free_date = max(last_end_date, self.today) + timedelta(days=30)
+        self.created_ids = []
+
+        results = {}
+        with transaction.atomic():
+            for case in cases or self.cases:
+                results[case] = self.measure(getattr(self, case))
+                if log is not None:
+                    log("{:<16} {throughput_per_s:>10} ops/s  p50 {p50_ms:>9} ms  p95 {p95_ms:>9} ms  p99 {p99_ms:>9} ms  errors {errors}".format(case, **results[case]))
+            transaction.set_rollback(True)
+
+        return {
+            'meta': {
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'commit': get_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'rooms': len(rooms),
+                'bookings': Booking.objects.count(),
+                'iterations': self.iterations,
+            },
+            'results': results,
+        }
+
+    def measure(self, operation):
+        for i in range(self.warmup):
+            operation(i)
+        timings = []
+        errors = 0
+        started = time.perf_counter()
+        for i in range(self.warmup, self.warmup + self.iterations):
+            start = time.perf_counter()
+            ok = operation(i)
+            timings.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+        return summarize(timings, errors, time.perf_counter() - started)
+
+    def get_booking_data(self, i):
+        room = self.rooms[i % len(self.rooms)]
+        start_date = self.free_date + timedelta(days=2 * (i // len(self.rooms)))
+        return {
+            "start_date": str(start_date),
+            "end_date": str(start_date + timedelta(days=1)),
+            "name": "Benchmark",
+            "surname": str(i),
+            "number_of_people": 1,
+            "room_ids": str(room.id),
+        }
+
+    def booking_create(self, i):
+        response = self.client.post("/api/booking/", self.get_booking_data(i))
+        if response.status_code == 201:
+            self.created_ids.append((i, response.data["id"]))
+        return response.status_code == 201
+
+    def booking_update(self, i):
+        if not self.created_ids:
+            return False
+        index, booking_id = self.created_ids[i % len(self.created_ids)]
+        booking_data = self.get_booking_data(index)
+        booking_data["name"] = "Updated " + str(i)
+        response = self.client.put("/api/booking/{}/".format(booking_id), json.dumps(booking_data), content_type="application/json")
+        return response.status_code == 200
+
+    def get_random_period(self, max_nights=7):
+        start_date = self.today + timedelta(days=self.random.randrange(self.horizon))
+        return start_date, start_date + timedelta(days=self.random.randint(1, max_nights))
+
+    def booking_list(self, i):
+        start_date, end_date = self.get_random_period()
+        params = {"overlaps_from": str(start_date), "overlaps_to": str(end_date), "pagination": "cursor"}
+        if self.category_ids:
+            params["room_category"] = self.random.choice(self.category_ids)
+        return self.client.get("/api/booking/", params).status_code == 200
+
+    def availability(self, i):
+        start_date, end_date = self.get_random_period()
+        params = {"start_date": str(start_date), "end_date": str(end_date), "number_of_people": self.random.randint(1, 6)}
+        return self.client.get("/api/room/available/", params).status_code == 200
+
+    def serialization(self, i):
+        if not hasattr(self, 'page'):
+            # a page of bookings with their rooms is fetched once, only serializing it is measured
+            self.page = list(Booking.prefetch_room_bookings(Booking.objects.filter(end_date__gt=self.today).order_by('start_date', 'id'))[:200])
+        return len(BookingSerializer(self.page, many=True).data) == len(self.page)
+
+    def parsing(self, i):
+        # a thousand payloads per operation, so that the time is above the resolution of results
+        booking_data = self.get_booking_data(i)
+        booking_data["room_ids"] = ",".join(str(room.id) for room in self.rooms[:3])
+        for repeat in range(1000):
+            booking_request = BookingRequest.parse(booking_data)
+            Booking.is_date_range_correct(booking_request.start_date, booking_request.end_date)
+        return booking_request.get_duration() == 1
+
+
+def compare_results(results, baseline):
+    """
+    Returns relative changes of throughput and median latency of cases found in both results, e.g. 0.1 for 10% more
+    """
+    changes = {}
+    for case, result in results['results'].items():
+        previous = baseline.get('results', {}).get(case)
+        if not previous:
+            continue
+        changes[case] = {
+            key: round(result[key] / previous[key] - 1, 4) if result.get(key) and previous.get(key) else None
+            for key in ('throughput_per_s', 'p50_ms', 'p95_ms')
+        }
+    return changes
@@ -0,0 +1,195 @@
+import csv
+import json
+from datetime import datetime, timedelta
+
+from django.db import connection, IntegrityError
+
+from reservations.models import Room, Booking, RoomBooking, RoomNight, DailyStat
+from reservations.serializers import BookingSerializer
+from reservations.availability import invalidate_room_index
+from reservations.pricing import QuoteEngine
+from reservations.database import locked_write, DatabaseBusy
+from reservations.parsing import parse_date, parse_integer, parse_room_ids, check_stay_length
+
+
+def read_booking_rows(lines, file_format):
+    """
+    Returns booking rows from lines of a JSON Lines or a CSV file with a header
+    """
+    if file_format == 'csv':
+        return list(csv.DictReader(lines))
+    if file_format == 'jsonl':
+        rows = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise Exception("Incorrect JSON on line {}".format(number))
+        return rows
+    raise Exception("Unsupported format: " + str(file_format))
+
+
+def parse_booking_row(row):
+    """
+    Returns booking data with typed values for a single imported row
+    """
+    return {
+        "start_date": parse_date(row["start_date"]),
+        "end_date": parse_date(row["end_date"]),
+        "name": row.get("name"),
+        "surname": row.get("surname"),
+        "number_of_people": parse_integer(row["number_of_people"]),
+        "room_ids": parse_room_ids(row["room_ids"])
+    }
+
+
+def get_row_errors(data):
+    """
+    Returns a message of fields of parsed booking data rejected by the booking serializer, or None if they are all valid.
+    Guest names and the number of people are checked the same way as bookings made through the API.
+    """
+    serializer = BookingSerializer(data=dict(((field, value) for field, value in data.items() if value is not None), cost=0))
+    if serializer.is_valid():
+        return None
+    return "; ".join("{}: {}".format(field, " ".join(str(message) for message in messages)) for field, messages in serializer.errors.items())
+
+
+def describe_integrity_error(err):
+    """
+    Returns a message of a database constraint rejecting a row, a taken room night being the usual one
+    """
+    if 'roomnight' in str(err).lower():
+        return "Rooms booked already for given date range"
+    return "Incorrect row: " + str(err)
+
+
+class BookingImport:
+    """
+    Imports a batch of bookings.
+    The whole batch is validated in memory against rooms and room nights fetched upfront, including conflicts between rows
+    of the batch, and the accepted rows are written with bulk inserts in chunked transactions.
+    Chunks take the write lock like single bookings do, once the database stays busy the rows left are reported as such.
+    """
+    def __init__(self, rows, chunk_size=1000):
+        self.rows = rows
+        self.chunk_size = chunk_size
+        self.report = [{"row": number, "status": "error"} for number in range(1, len(rows) + 1)]
+        self.busy = False
+
+    def run(self):
+        """
+        Returns a status report with one entry per row
+        """
+        accepted = self.validate()
+        for start in range(0, len(accepted), self.chunk_size):
+            self.write(accepted[start:start + self.chunk_size])
+        invalidate_room_index()
+        return self.report
+
+    def validate(self):
+        parsed = []
+        for index, row in enumerate(self.rows):
+            try:
+                data = parse_booking_row(row)
+            except (KeyError, TypeError, ValueError) as err:
+                self.report[index]["error"] = "Incorrect row: " + str(err)
+                continue
+            errors = get_row_errors(data)
+            if errors is not None:
+                self.report[index]["error"] = "Incorrect row: " + errors
+                continue
+            parsed.append((index, data))
+        if not parsed:
+            return []
+
+        room_ids = set(room_id for index, data in parsed for room_id in data["room_ids"])
+        rooms = Room.objects.in_bulk(list(room_ids))
+        start_date = min(data["start_date"] for index, data in parsed)
+        end_date = max(data["end_date"] for index, data in parsed)
+        taken = set(RoomNight.objects.filter(room__in=list(rooms), night__gte=start_date, night__lt=end_date).values_list('room_id', 'night'))
+
+        today = datetime.today().date()
+        accepted = []
+        for index, data in parsed:
+            try:
+                booking_rooms = self.validate_booking(data, rooms, taken, today)
+            except Exception as err:
+                self.report[index]["error"] = str(err)
+                continue
+            nights = [data["start_date"] + timedelta(days=day) for day in range((data["end_date"] - data["start_date"]).days)]
+            taken.update((room.id, night) for room in booking_rooms for night in nights)
+            accepted.append((index, data, booking_rooms))
+        return accepted
+
+    def validate_booking(self, data, rooms, taken, today):
+        if not (data["start_date"] >= today and data["end_date"] > data["start_date"]):
+            raise Exception("Incorrect date range")
+        check_stay_length(data["start_date"], data["end_date"])
+        missing_room_ids = [str(room_id) for room_id in data["room_ids"] if room_id not in rooms]
+        if missing_room_ids:
+            raise Exception("Rooms do not exist: " + ", ".join(missing_room_ids))
+        booking_rooms = [rooms[room_id] for room_id in data["room_ids"]]
+        conflicting_room_ids = set(
+            room.id for room in booking_rooms for day in range((data["end_date"] - data["start_date"]).days)
+            if (room.id, data["start_date"] + timedelta(days=day)) in taken
+        )
+        if conflicting_room_ids:
+            raise Exception("Rooms booked already for given date range: " + ", ".join(str(room_id) for room_id in sorted(conflicting_room_ids)))
+        if not Room.check_rooms_capacity(booking_rooms, data["number_of_people"]):
+            raise Exception("Rooms have insufficient capacity")
+        return booking_rooms
+
+    def report_busy(self, chunk):
+        for index, data, rooms in chunk:
+            self.report[index]["error"] = "Database is busy, please try again"
+
+    def build_booking(self, data, rooms, engine):
+        return Booking(
+            start_date=data["start_date"],
+            end_date=data["end_date"],
+            name=data["name"],
+            surname=data["surname"],
+            number_of_people=data["number_of_people"],
+            cost=engine.quote(rooms, data["start_date"], data["end_date"])
+        )
+
+    def write(self, chunk):
+        if self.busy:
+            # the database stayed busy for an earlier chunk, this one would wait for it in vain
+            self.report_busy(chunk)
+            return
+        try:
+            with locked_write(Booking):
+                # a single engine prices all bookings of the chunk
+                engine = QuoteEngine.for_stays([(rooms, data["start_date"], data["end_date"]) for index, data, rooms in chunk])
+                bookings = [self.build_booking(data, rooms, engine) for index, data, rooms in chunk]
+                if getattr(connection.features, 'can_return_ids_from_bulk_insert', False) or getattr(connection.features, 'can_return_rows_from_bulk_insert', False):
+                    Booking.objects.bulk_create(bookings)
+                else:
+                    # the database doesn't return primary keys of bulk inserted rows
+                    for booking in bookings:
+                        booking.save()
+                RoomBooking.objects.bulk_create([
+                    RoomBooking(room=room, booking=booking) for booking, (index, data, rooms) in zip(bookings, chunk) for room in rooms
+                ])
+                room_nights = [
+                    room_night for booking, (index, data, rooms) in zip(bookings, chunk) for room_night in booking.build_room_nights(rooms, engine)
+                ]
+                RoomNight.objects.bulk_create(room_nights)
+                DailyStat.add_room_nights(room_nights)
+        except DatabaseBusy:
+            self.busy = True
+            self.report_busy(chunk)
+            return
+        except IntegrityError as err:
+            # usually rooms have been booked by a concurrent request, retry the chunk row by row to find out which ones
+            if len(chunk) > 1:
+                for row in chunk:
+                    self.write([row])
+            else:
+                self.report[chunk[0][0]]["error"] = describe_integrity_error(err)
+            return
+        for booking, (index, data, rooms) in zip(bookings, chunk):
+            self.report[index] = {"row": index + 1, "status": "created", "id": booking.id}
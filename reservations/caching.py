@@ -0,0 +1,133 @@
+from hashlib import md5
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def get_cache_version(scope):
+    """
+    Returns a (token, last modified timestamp) pair of the scope, stored in the cache so that all workers sharing it agree on them
+    """
+    key = 'version:' + scope
+    version = cache.get(key)
+    if version is None:
+        version = (uuid.uuid4().hex, int(time.time()))
+        if not cache.add(key, version, None):
+            # added by another worker in the meantime
+            version = cache.get(key, version)
+    return version
+
+
+def bump_cache_version(scope):
+    """
+    Makes responses of the scope cached so far stale.
+    The version is changed right away and once more when the current transaction commits,
+    so that a response built by a concurrent request before the commit is not cached under the new version.
+    """
+    def bump():
+        # Last-Modified has a resolution of a second, every version gets a later second than the previous one
+        # so that a response cached within the second of a write is never taken for the current one
+        key = 'version:' + scope
+        previous = cache.get(key)
+        modified = int(time.time()) if previous is None else max(int(time.time()), previous[1] + 1)
+        cache.set(key, (uuid.uuid4().hex, modified), None)
+    bump()
+    transaction.on_commit(bump)
+
+
+class CachedResponseMixin:
+    """
+    Caches rendered responses of GET requests until the cache version of the view's scope is bumped,
+    and answers conditional requests with 304 Not Modified using ETag and Last-Modified headers.
+    Versions are bumped by signal receivers on saves and deletes, writes bypassing signals like QuerySet.update are not noticed.
+    Pages of the browsable API are never cached, they embed the CSRF token of the client they were rendered for.
+    """
+    cache_scope = None
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'api':
+            return super().get(request, *args, **kwargs)
+        token, modified = get_cache_version(self.cache_scope)
+        # the representation depends on the URL and on the negotiated renderer
+        representation = "{} {}".format(request.get_full_path(), request.accepted_media_type)
+        self.response_etag = quote_etag(md5("{} {}".format(token, representation).encode('utf-8')).hexdigest())
+        self.response_modified = modified
+        self.response_cache_key = 'response:{}:{}'.format(self.cache_scope, self.response_etag.strip('"'))
+
+        if self.is_not_modified(request):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        cached = cache.get(self.response_cache_key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        return super().get(request, *args, **kwargs)
+
+    def is_not_modified(self, request):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return self.response_etag in [etag.strip() for etag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and self.response_modified <= if_modified_since
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method != 'GET' or not hasattr(self, 'response_etag'):
+            return response
+        if response.status_code == status.HTTP_200_OK and isinstance(response, Response):
+            response.render()
+            cache.set(self.response_cache_key, (response.content, response['Content-Type']), getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.response_etag
+            response['Last-Modified'] = http_date(self.response_modified)
+        return response
+
+
+_booking_cache_lock = threading.Lock()
+_booking_cache_counters = {'hits': 0, 'misses': 0}
+
+
+def get_cached_booking(booking_id):
+    """
+    Returns serialized data of the booking, read from the cache or fetched with its room numbers and cached,
+    or None if the booking does not exist. Entries are keyed by the booking version and the version of rooms,
+    so renumbering a room makes them stale too.
+    """
+    from reservations.models import Booking
+    from reservations.serializers import BookingSerializer
+
+    booking_token, modified = get_cache_version('booking:{}'.format(booking_id))
+    rooms_token, modified = get_cache_version('rooms')
+    key = 'booking:{}:{}:{}'.format(booking_id, booking_token, rooms_token)
+    data = cache.get(key)
+    with _booking_cache_lock:
+        _booking_cache_counters['hits' if data is not None else 'misses'] += 1
+    if data is not None:
+        return data
+
+    booking = Booking.prefetch_room_bookings(Booking.objects.filter(pk=booking_id)).first()
+    if booking is None:
+        return None
+    data = dict(BookingSerializer(booking).data)
+    cache.set(key, data, getattr(settings, 'BOOKING_CACHE_TIMEOUT', 300))
+    return data
+
+
+def invalidate_cached_booking(booking_id):
+    bump_cache_version('booking:{}'.format(booking_id))
+
+
+def get_booking_cache_stats():
+    """
+    Returns numbers of hits and misses of the booking cache counted by this process
+    """
+    with _booking_cache_lock:
+        hits, misses = _booking_cache_counters['hits'], _booking_cache_counters['misses']
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None}
@@ -0,0 +1,129 @@
+from collections import deque
+from contextlib import contextmanager
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction, OperationalError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+# Pragmas set on every new SQLite connection, single ones are changed or added by the SQLITE_PRAGMAS setting
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+}
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Sets pragmas of a new SQLite connection. In WAL mode readers don't block the writer and the writer doesn't block readers,
+    and with synchronous set to NORMAL commits don't wait for the disk, at the risk of losing the last transactions on power loss.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {}))
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def lock_for_writing(model):
+    """
+    Takes the write lock of SQLite at the start of a transaction, like BEGIN IMMEDIATE does.
+    A transaction which reads first and writes later can't wait for another writer, SQLite fails it right away
+    as the data it read may have changed, while taking the lock before reading waits for up to the busy timeout.
+    Does nothing on other databases, where rows are locked with select_for_update.
+    """
+    if connection.vendor != 'sqlite' or not connection.in_atomic_block:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE {} SET id = id WHERE 0'.format(table))
+
+
+class DatabaseBusy(Exception):
+    """
+    Raised when a write can't get the database in time, answered with 503 responses
+    """
+    pass
+
+
+class WriteQueueFull(DatabaseBusy):
+    pass
+
+
+class WriteQueue:
+    """
+    Lets threads of a process write one at a time, in the order they came.
+    A thread waits at most timeout seconds for its turn, and when max_waiting threads are waiting already
+    it's refused right away, so that a burst of writes gets quick 503 responses instead of piling up.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = deque()
+        self.busy = False
+
+    def acquire(self, max_waiting, timeout):
+        with self.lock:
+            if not self.busy:
+                self.busy = True
+                return
+            if len(self.waiters) >= max_waiting:
+                raise WriteQueueFull()
+            turn = threading.Event()
+            self.waiters.append(turn)
+        if turn.wait(timeout):
+            return
+        with self.lock:
+            # the turn may have been handed over right after the wait timed out
+            if turn.is_set():
+                return
+            self.waiters.remove(turn)
+        raise WriteQueueFull()
+
+    def release(self):
+        with self.lock:
+            if self.waiters:
+                self.waiters.popleft().set()
+            else:
+                self.busy = False
+
+
+write_queue = WriteQueue()
+
+
+@contextmanager
+def serialized_write():
+    """
+    Waits for the turn of the current thread in the write queue when SQLITE_WRITE_QUEUE is on and the database is SQLite,
+    raises WriteQueueFull when the queue is full or the turn doesn't come within SQLITE_WRITE_QUEUE_TIMEOUT seconds
+    """
+    if not getattr(settings, 'SQLITE_WRITE_QUEUE', False) or connection.vendor != 'sqlite':
+        yield
+        return
+    write_queue.acquire(getattr(settings, 'SQLITE_WRITE_QUEUE_SIZE', 32), getattr(settings, 'SQLITE_WRITE_QUEUE_TIMEOUT', 10))
+    try:
+        yield
+    finally:
+        write_queue.release()
+
+
+@contextmanager
+def locked_write(model):
+    """
+    Runs the block in a transaction writing to the database: waits for a turn in the write queue if it's on,
+    takes the write lock of SQLite up front with lock_for_writing and raises DatabaseBusy
+    when the queue is full or the lock doesn't come within the busy timeout
+    """
+    try:
+        with serialized_write(), transaction.atomic():
+            lock_for_writing(model)
+            yield
+    except OperationalError as err:
+        if "locked" not in str(err):
+            raise
+        raise DatabaseBusy() from err
@@ -0,0 +1,69 @@
+import csv
+import json
+
+from reservations.models import RoomBooking
+
+
+# IDs of bookings of a chunk are passed as query parameters, older SQLite builds allow at most 999 of them
+MAX_CHUNK_SIZE = 900
+
+EXPORT_FIELDS = ['id', 'start_date', 'end_date', 'name', 'surname', 'number_of_people', 'cost', 'room_ids', 'room_numbers']
+
+
+def iterate_bookings(queryset, chunk_size=500):
+    """
+    Yields bookings of the queryset as dicts with their room IDs and numbers, keeping only a single chunk in memory.
+    Chunks are read in the order of IDs, starting after the last ID of the previous chunk,
+    and rooms are fetched with a single query per chunk, by the IDs of its bookings so that a sparse filter reads no other rows.
+    """
+    queryset = queryset.order_by('id').values(*EXPORT_FIELDS[:-2])
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1]['id']
+
+        rooms = {}
+        room_bookings = RoomBooking.objects.filter(booking_id__in=[booking['id'] for booking in chunk]).order_by('id')
+        for booking_id, room_id, number in room_bookings.values_list('booking_id', 'room_id', 'room__number'):
+            rooms.setdefault(booking_id, []).append((room_id, number))
+
+        for booking in chunk:
+            booking_rooms = rooms.get(booking['id'], [])
+            booking['room_ids'] = ",".join(str(room_id) for room_id, number in booking_rooms)
+            booking['room_numbers'] = [number for room_id, number in booking_rooms]
+            yield booking
+
+
+class Echo:
+    """
+    File-like object returning what is written to it, lets csv.writer produce lines one by one
+    """
+    def write(self, value):
+        return value
+
+
+def export_csv(bookings):
+    """
+    Yields lines of a CSV file with a header row
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for booking in bookings:
+        booking['room_numbers'] = ",".join(str(number) for number in booking['room_numbers'])
+        yield writer.writerow([booking[field] for field in EXPORT_FIELDS])
+
+
+def export_jsonl(bookings):
+    """
+    Yields lines of a JSON Lines file
+    """
+    for booking in bookings:
+        yield json.dumps(booking, default=str) + "\n"
+
+
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv'),
+    'jsonl': (export_jsonl, 'application/x-ndjson'),
+}
@@ -0,0 +1,44 @@
+import django_filters
+
+from reservations.models import Booking, RoomBooking
+
+
+class BookingFilter(django_filters.FilterSet):
+    """
+    Filters of the booking list, every one of them translates to an indexed SQL predicate.
+    Bookings overlapping a period are selected with overlaps_from and overlaps_to, which can be used on their own,
+    and bookings of guests staying in the hotel on the night of a given date with in_house.
+    """
+    start_date_after = django_filters.DateFilter(field_name='start_date', lookup_expr='gte')
+    start_date_before = django_filters.DateFilter(field_name='start_date', lookup_expr='lte')
+    end_date_after = django_filters.DateFilter(field_name='end_date', lookup_expr='gte')
+    end_date_before = django_filters.DateFilter(field_name='end_date', lookup_expr='lte')
+    overlaps_from = django_filters.DateFilter(field_name='end_date', lookup_expr='gt')
+    overlaps_to = django_filters.DateFilter(field_name='start_date', lookup_expr='lt')
+    in_house = django_filters.DateFilter(method='filter_in_house')
+    room_number = django_filters.CharFilter(method='filter_room_number')
+    room_category = django_filters.CharFilter(method='filter_room_category')
+
+    class Meta:
+        model = Booking
+        fields = ['start_date', 'end_date', 'name', 'surname', 'number_of_people', 'cost']
+
+    def filter_in_house(self, queryset, name, value):
+        return queryset.filter(start_date__lte=value, end_date__gt=value)
+
+    # bookings of given rooms or room categories are selected with subqueries on room bookings,
+    # both filters accept multiple values given multiple times or separated by commas
+
+    def get_list_values(self, name, value):
+        values = self.data.getlist(name) if hasattr(self.data, 'getlist') else [value]
+        return [item for values_item in values for item in values_item.split(',') if item]
+
+    def filter_room_number(self, queryset, name, value):
+        room_numbers = self.get_list_values(name, value)
+        if not all(room_number.isdigit() for room_number in room_numbers):
+            return queryset.none()
+        return queryset.filter(pk__in=RoomBooking.objects.filter(room__number__in=room_numbers).values('booking_id'))
+
+    def filter_room_category(self, queryset, name, value):
+        room_categories = self.get_list_values(name, value)
+        return queryset.filter(pk__in=RoomBooking.objects.filter(room__category__in=room_categories).values('booking_id'))
@@ -0,0 +1,333 @@
+import asyncio
+from datetime import datetime, timedelta
+import http.client
+import json
+import os
+import random
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+from django.db.models import Max
+
+from reservations.benchmarks import summarize
+from reservations.database import locked_write
+from reservations.models import Room, Booking
+
+
+LOADTEST_NAME = 'Loadtest'
+
+# relative weights of operations of the default request mix
+DEFAULT_MIX = {
+    'list_bookings': 40,
+    'list_rooms': 10,
+    'availability': 10,
+    'create_booking': 15,
+    'update_booking': 15,
+    'conflicting_booking': 10,
+}
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class InProcessServer:
+    """
+    Serves the WSGI application from a background thread, a thread per request
+    """
+    def __init__(self, application):
+        self.server = make_server('127.0.0.1', 0, application, server_class=ThreadingWSGIServer, handler_class=QuietRequestHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ASGIServer:
+    """
+    Serves an ASGI application from an event loop in a background thread, one connection per request.
+    It only reads what the load test sends: a request line, headers and a body of Content-Length bytes.
+    """
+    def __init__(self, application):
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, '127.0.0.1', 0, backlog=1024))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def shutdown(self):
+        self.server.close()
+        # requests still being answered, or read from connections just closed by slow clients, are given time to finish
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=10)
+
+    async def handle(self, reader, writer):
+        try:
+            method, target, version = (await reader.readline()).decode('latin-1').split()
+            headers = []
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, separator, value = line.decode('latin-1').partition(':')
+                headers.append((name.strip().lower().encode('latin-1'), value.strip().encode('latin-1')))
+            length = int(dict(headers).get(b'content-length', 0))
+            body = await reader.readexactly(length) if length else b''
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        url = urlsplit(target)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': version.split('/')[-1], 'method': method,
+            'scheme': 'http', 'path': url.path, 'query_string': url.query.encode('latin-1'), 'root_path': '',
+            'headers': headers, 'client': writer.get_extra_info('peername')[:2], 'server': ('127.0.0.1', self.port),
+        }
+        received = []
+
+        async def receive():
+            if received:
+                return {'type': 'http.disconnect'}
+            received.append(True)
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                writer.write('HTTP/1.1 {} {}\r\n'.format(message['status'], http.client.responses.get(message['status'], '')).encode('latin-1'))
+                for name, value in message.get('headers', []):
+                    writer.write(name + b': ' + value + b'\r\n')
+                writer.write(b'Connection: close\r\n\r\n')
+            else:
+                writer.write(message.get('body', b''))
+                await writer.drain()
+
+        try:
+            await self.application(scope, receive, send)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class GunicornServer:
+    """
+    Runs the project under gunicorn with a number of worker processes, using the same settings and database
+    """
+    def __init__(self, workers):
+        with socket.socket() as free_socket:
+            free_socket.bind(('127.0.0.1', 0))
+            self.port = free_socket.getsockname()[1]
+        self.command = [sys.executable, '-m', 'gunicorn', 'hotel_app.wsgi', '--workers', str(workers), '--bind', '127.0.0.1:{}'.format(self.port), '--log-level', 'warning']
+        self.process = None
+
+    def start(self, timeout=15):
+        self.process = subprocess.Popen(self.command, env=os.environ.copy())
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("gunicorn exited with code {}, is it installed?".format(self.process.returncode))
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("gunicorn did not start listening within {} seconds".format(timeout))
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(10)
+
+
+class LoadTest:
+    """
+    Replays a weighted mix of booking and room requests from concurrent clients against a running server and collects
+    latencies, status codes and errors of every operation. Conflicting bookings all target the same room and nights,
+    so that all but the first are rejected, and 503 responses tell how often SQLite was locked by another writer.
+    Slow clients open connections and send only a part of a request during the whole test, like clients on slow networks.
+    """
+    def __init__(self, port, concurrency=8, duration=10, requests=None, mix=None, seed=None, slow_clients=0):
+        self.port = port
+        self.concurrency = concurrency
+        self.slow_clients = slow_clients
+        self.duration = duration
+        self.requests = requests
+        self.mix = mix or DEFAULT_MIX
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.samples = []
+        self.created_ids = []
+        self.counter = 0
+
+    def prepare(self):
+        self.room_ids = list(Room.objects.order_by('id').values_list('id', flat=True))
+        if not self.room_ids:
+            raise ValueError("There are no rooms, fill the database with the seed_hotel command first")
+        today = datetime.today().date()
+        last_end_date = Booking.objects.aggregate(end_date=Max('end_date'))['end_date'] or today
+        self.horizon = max((last_end_date - today).days, 1)
+        self.today = today
+        # new bookings start after all existing ones, and the conflicting ones are made on a night before them
+        self.conflict_date = max(last_end_date, today) + timedelta(days=30)
+        self.free_date = self.conflict_date + timedelta(days=2)
+
+    def run(self):
+        self.prepare()
+        operations = list(self.mix)
+        weights = [self.mix[operation] for operation in operations]
+        self.deadline = time.monotonic() + self.duration if self.requests is None else None
+        threads = [threading.Thread(target=self.client, args=(index, operations, weights)) for index in range(self.concurrency)]
+        slow_connections = [self.open_slow_connection() for index in range(self.slow_clients)]
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for slow_connection in slow_connections:
+                slow_connection.close()
+        return self.report(time.perf_counter() - started)
+
+    def open_slow_connection(self):
+        slow_connection = socket.create_connection(('127.0.0.1', self.port), timeout=30)
+        slow_connection.sendall(b'POST /api/booking/ HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n')
+        return slow_connection
+
+    def next_request_number(self):
+        with self.lock:
+            if self.requests is not None and self.counter >= self.requests:
+                return None
+            self.counter += 1
+            return self.counter
+
+    def client(self, index, operations, weights):
+        generator = random.Random(None if self.seed is None else self.seed + index)
+        while self.deadline is None or time.monotonic() < self.deadline:
+            number = self.next_request_number()
+            if number is None:
+                return
+            operation = generator.choices(operations, weights)[0]
+            method, path, body = getattr(self, operation)(number, generator)
+            start = time.perf_counter()
+            try:
+                status, content = self.send(method, path, body)
+            except (OSError, http.client.HTTPException) as err:
+                status, content = None, str(err)
+            elapsed = time.perf_counter() - start
+            if operation in ('create_booking', 'conflicting_booking') and status == 201:
+                with self.lock:
+                    self.created_ids.append((json.loads(content)["id"], body))
+            # errors of writes not turned into 503 responses still mention the locked database
+            locked = status == 500 and isinstance(content, bytes) and b"locked" in content
+            with self.lock:
+                self.samples.append((operation, status, elapsed, locked))
+
+    def send(self, method, path, body):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def get_random_period(self, generator):
+        start_date = self.today + timedelta(days=generator.randrange(self.horizon))
+        return start_date, start_date + timedelta(days=generator.randint(1, 7))
+
+    def list_bookings(self, number, generator):
+        start_date, end_date = self.get_random_period(generator)
+        return 'GET', '/api/booking/?' + urlencode({'overlaps_from': start_date, 'overlaps_to': end_date, 'pagination': 'cursor'}), None
+
+    def list_rooms(self, number, generator):
+        return 'GET', '/api/room/?' + urlencode({'page': generator.randint(1, max(1, len(self.room_ids) // 200))}), None
+
+    def availability(self, number, generator):
+        start_date, end_date = self.get_random_period(generator)
+        return 'GET', '/api/room/available/?' + urlencode({'start_date': start_date, 'end_date': end_date, 'number_of_people': generator.randint(1, 4)}), None
+
+    def get_booking_data(self, room_id, start_date):
+        return {
+            'start_date': str(start_date),
+            'end_date': str(start_date + timedelta(days=1)),
+            'name': LOADTEST_NAME,
+            'surname': 'Guest',
+            'number_of_people': 1,
+            'room_ids': str(room_id),
+        }
+
+    def create_booking(self, number, generator):
+        # every request books another room, or another night once all rooms were booked
+        room_id = self.room_ids[number % len(self.room_ids)]
+        start_date = self.free_date + timedelta(days=2 * (number // len(self.room_ids)))
+        return 'POST', '/api/booking/', self.get_booking_data(room_id, start_date)
+
+    def conflicting_booking(self, number, generator):
+        return 'POST', '/api/booking/', self.get_booking_data(self.room_ids[0], self.conflict_date)
+
+    def update_booking(self, number, generator):
+        with self.lock:
+            created = generator.choice(self.created_ids) if self.created_ids else None
+        if created is None:
+            return self.create_booking(number, generator)
+        booking_id, body = created
+        return 'PUT', '/api/booking/{}/'.format(booking_id), dict(body, surname='Guest {}'.format(number))
+
+    def report(self, elapsed):
+        with self.lock:
+            samples = list(self.samples)
+        results = {}
+        for operation in list(self.mix) + ['total']:
+            operation_samples = [sample for sample in samples if operation == 'total' or sample[0] == operation]
+            if not operation_samples:
+                continue
+            server_errors = sum(1 for name, status, latency, locked in operation_samples if status is None or status >= 500)
+            result = summarize([latency for name, status, latency, locked in operation_samples], server_errors, elapsed)
+            result['error_rate'] = round(server_errors / len(operation_samples), 4)
+            result['rejected'] = sum(1 for name, status, latency, locked in operation_samples if status is not None and 400 <= status < 500)
+            # the API answers 503 when SQLite stays locked by another writer longer than the busy timeout
+            result['lock_contention'] = sum(1 for name, status, latency, locked in operation_samples if status == 503 or locked)
+            statuses = {}
+            for name, status, latency, locked in operation_samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            result['statuses'] = statuses
+            results[operation] = result
+        return results
+
+
+def delete_loadtest_bookings():
+    """
+    Deletes bookings made by load tests along with their room nights and stats, returns their number
+    """
+    with locked_write(Booking):
+        count, deleted = Booking.objects.filter(name=LOADTEST_NAME).delete()
+    return deleted.get(Booking._meta.label, 0)
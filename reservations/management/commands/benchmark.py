@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.benchmarks import BookingBenchmark, compare_results
+
+
+class Command(BaseCommand):
+    help = 'Measures throughput and latency of booking creation, update, listing, free room search and serialization, and writes results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Number of measured operations of every case')
+        parser.add_argument('--warmup', type=int, default=10, help='Number of operations of every case run before measuring')
+        parser.add_argument('--cases', help='Cases to run, separated by commas, out of: ' + ', '.join(BookingBenchmark.cases))
+        parser.add_argument('--seed', type=int, help='Seed of the random generator of query parameters')
+        parser.add_argument('--output', help='File to write results to as JSON, printed by default')
+        parser.add_argument('--compare', help='JSON file of earlier results to report relative changes against')
+
+    def handle(self, *args, **options):
+        cases = options['cases'].split(',') if options['cases'] else None
+        unknown_cases = [case for case in cases or [] if case not in BookingBenchmark.cases]
+        if unknown_cases:
+            raise CommandError("Unknown cases: " + ", ".join(unknown_cases))
+
+        benchmark = BookingBenchmark(options['iterations'], options['warmup'], options['seed'])
+        try:
+            results = benchmark.run(cases, log=self.stderr.write)
+        except ValueError as err:
+            raise CommandError(str(err))
+
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                results['changes'] = compare_results(results, json.load(baseline))
+            for case, changes in results['changes'].items():
+                self.stderr.write("{:<16} throughput {throughput_per_s:+.1%}  p50 {p50_ms:+.1%}  p95 {p95_ms:+.1%}".format(
+                    case, **{key: value or 0 for key, value in changes.items()}
+                ))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,91 @@
+from base64 import b64encode
+from datetime import datetime, timedelta
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+
+from reservations.models import Booking
+from reservations.pagination import BookingPagination
+
+
+def seed_bookings(number_of_bookings, batch_size=10000):
+    """
+    Inserts synthetic bookings without rooms, starting within three years from today
+    """
+    today = datetime.today().date()
+    for start in range(0, number_of_bookings, batch_size):
+        with transaction.atomic():
+            bookings = []
+            for i in range(start, min(start + batch_size, number_of_bookings)):
+                start_date = today + timedelta(days=random.randrange(3 * 365))
+                bookings.append(Booking(
+                    start_date=start_date,
+                    end_date=start_date + timedelta(days=random.randint(1, 7)),
+                    name="Guest",
+                    surname=str(i),
+                    number_of_people=random.randint(1, 4),
+                    cost=random.randint(100, 2000)
+                ))
+            Booking.objects.bulk_create(bookings)
+
+
+class Command(BaseCommand):
+    help = 'Measures fetch times of booking list pages at increasing depths with page number and cursor pagination'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=1000000, help='Number of bookings to run against')
+        parser.add_argument('--seed', action='store_true', help='Insert synthetic bookings when the database has fewer, use a scratch database (see SQLITE_PATH)')
+        parser.add_argument('--depths', default='1,10,100,1000,5000', help='Page numbers to fetch, separated by commas')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of fetches of every page, the median is reported')
+        parser.add_argument('--output', help='File to write results to as JSON')
+
+    def handle(self, *args, **options):
+        count = Booking.objects.count()
+        if count < options['bookings']:
+            if not options['seed']:
+                raise CommandError("The database has {} bookings, pass --seed to add synthetic ones".format(count))
+            self.stderr.write("Inserting {} bookings".format(options['bookings'] - count))
+            seed_bookings(options['bookings'] - count)
+            count = options['bookings']
+
+        client = Client()
+        page_size = BookingPagination.page_size
+        results = []
+        for depth in [int(depth) for depth in options['depths'].split(',')]:
+            offset = (depth - 1) * page_size
+            if offset >= count:
+                self.stderr.write("Skipping page {}, there are only {} bookings".format(depth, count))
+                continue
+
+            cursor_params = {'pagination': 'cursor'}
+            if depth > 1:
+                # position of the last booking of the previous page, as a client following next links would get it
+                start_date, booking_id = Booking.objects.order_by('start_date', 'id').values_list('start_date', 'id')[offset - 1]
+                cursor_params['cursor'] = b64encode(json.dumps([str(start_date), str(booking_id)]).encode('utf-8')).decode('ascii')
+
+            result = {
+                'page': depth,
+                'page_number_ms': self.measure(client, {'page': depth}, options['repeat']),
+                'cursor_ms': self.measure(client, cursor_params, options['repeat']),
+            }
+            results.append(result)
+            self.stdout.write("page {page:>6}: page number {page_number_ms:>9.2f} ms, cursor {cursor_ms:>9.2f} ms".format(**result))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'bookings': count, 'page_size': page_size, 'results': results}, output, indent=2)
+
+    def measure(self, client, params, repeat):
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            response = client.get('/api/booking/', params)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError("Fetching {} failed with status {}".format(params, response.status_code))
+        return statistics.median(timings)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from reservations.models import Booking
+from reservations.filters import BookingFilter
+from reservations.export import iterate_bookings, EXPORT_FORMATS, MAX_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Exports bookings as CSV or JSON Lines, streaming them in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=sorted(EXPORT_FORMATS), default='csv', help='File format, csv by default')
+        parser.add_argument('--output', help='File to write to, the standard output by default')
+        parser.add_argument('--filter', action='append', default=[], metavar='PARAM=VALUE', help='Booking list filter, e.g. --filter room_number=12')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of bookings read with a single query, at most {}'.format(MAX_CHUNK_SIZE))
+
+    def handle(self, *args, **options):
+        if not 1 <= options['chunk_size'] <= MAX_CHUNK_SIZE:
+            raise CommandError("Chunk size should be between 1 and {}".format(MAX_CHUNK_SIZE))
+        query_params = QueryDict(mutable=True)
+        for option in options['filter']:
+            if '=' not in option:
+                raise CommandError("Filters should be given as PARAM=VALUE: " + option)
+            param, value = option.split('=', 1)
+            query_params.appendlist(param, value)
+
+        export, content_type = EXPORT_FORMATS[options['file_format']]
+        filterset = BookingFilter(query_params, queryset=Booking.objects.all())
+        if not filterset.is_valid():
+            raise CommandError("Incorrect filters: " + str(dict(filterset.errors)))
+        bookings = iterate_bookings(filterset.qs, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(export(bookings))
+        else:
+            for line in export(bookings):
+                self.stdout.write(line, ending='')
@@ -0,0 +1,33 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.bulk import read_booking_rows, BookingImport
+
+
+class Command(BaseCommand):
+    help = 'Imports bookings from a JSON Lines or a CSV file and prints a status of every row as JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, use - to read from the standard input')
+        parser.add_argument('--format', dest='file_format', choices=['jsonl', 'csv'], help='File format, guessed from the file extension by default')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of bookings written in a single transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        try:
+            if path == '-':
+                rows = read_booking_rows(sys.stdin, file_format)
+            else:
+                with open(path, newline='') as lines:
+                    rows = read_booking_rows(lines, file_format)
+        except Exception as err:
+            raise CommandError(str(err))
+
+        report = BookingImport(rows, options['chunk_size']).run()
+        for row in report:
+            self.stdout.write(json.dumps(row))
+        created = sum(1 for row in report if row['status'] == 'created')
+        self.stderr.write("Imported {} of {} bookings".format(created, len(report)))
@@ -0,0 +1,71 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.loadtest import DEFAULT_MIX, InProcessServer, ASGIServer, GunicornServer, LoadTest, delete_loadtest_bookings
+
+
+def parse_mix(value):
+    """
+    Returns operation weights given as operation=weight pairs separated by commas
+    """
+    mix = {}
+    for item in value.split(','):
+        operation, separator, weight = item.partition('=')
+        if operation not in DEFAULT_MIX or not weight.isdigit():
+            raise CommandError("Incorrect mix item: {}, use operation=weight with operations: {}".format(item, ", ".join(DEFAULT_MIX)))
+        mix[operation] = int(weight)
+    if not any(mix.values()):
+        raise CommandError("All weights of the mix are 0")
+    return mix
+
+
+class Command(BaseCommand):
+    help = ('Replays a weighted mix of booking and room requests, including conflicting bookings, from concurrent clients '
+            'against the app served in-process through WSGI or ASGI or by gunicorn, and reports throughput, latency percentiles, errors and SQLite lock contention. '
+            'Bookings are written to the configured database, use a scratch one (see SQLITE_PATH) filled with seed_hotel.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['inprocess', 'asgi', 'gunicorn'], default='inprocess',
+                            help='Serve the WSGI app from threads of this process, the ASGI app from an event loop of this process or the WSGI app by gunicorn workers')
+        parser.add_argument('--workers', type=int, default=4, help='Number of gunicorn workers')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients')
+        parser.add_argument('--slow-clients', type=int, default=0, help='Number of clients holding connections with incomplete requests during the test')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to send requests for')
+        parser.add_argument('--requests', type=int, help='Total number of requests to send, instead of a duration')
+        parser.add_argument('--mix', help='Weights of operations as operation=weight pairs separated by commas, default: '
+                            + ",".join("{}={}".format(operation, weight) for operation, weight in DEFAULT_MIX.items()))
+        parser.add_argument('--seed', type=int, help='Seed of the random generators of clients')
+        parser.add_argument('--output', help='File to write results to as JSON')
+        parser.add_argument('--cleanup', action='store_true', help='Delete bookings made by the load test afterwards')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix']) if options['mix'] else None
+        if options['server'] == 'gunicorn':
+            server = GunicornServer(options['workers'])
+        elif options['server'] == 'asgi':
+            from hotel_app.asgi import application
+            server = ASGIServer(application)
+        else:
+            from hotel_app.wsgi import application
+            server = InProcessServer(application)
+
+        load_test = LoadTest(server.port, options['concurrency'], options['duration'], options['requests'], mix, options['seed'], options['slow_clients'])
+        try:
+            server.start()
+            results = load_test.run()
+        except (RuntimeError, ValueError) as err:
+            raise CommandError(str(err))
+        finally:
+            server.stop()
+            if options['cleanup']:
+                self.stderr.write("Deleted {} bookings of the load test".format(delete_loadtest_bookings()))
+
+        for operation, result in results.items():
+            self.stdout.write(
+                "{:<20} {operations:>7} requests {throughput_per_s:>9} req/s  p50 {p50_ms:>9} ms  p95 {p95_ms:>9} ms  p99 {p99_ms:>9} ms  "
+                "errors {error_rate:.2%}  rejected {rejected}  locked {lock_contention}".format(operation, **result)
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in ('server', 'workers', 'concurrency', 'slow_clients', 'duration', 'requests')}, 'mix': mix or DEFAULT_MIX, 'results': results}, output, indent=2)
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from reservations.models import RoomNight, DailyStat
+
+
+def get_expected_daily_stats():
+    """
+    Returns daily stats computed from room nights as a dict of (day, category ID) -> (occupied rooms, revenue)
+    """
+    room_nights = RoomNight.objects.values_list('night', 'room__category').annotate(rooms=Count('id'), revenue=Sum('rate')).order_by()
+    return {(night, category_id): (rooms, revenue) for night, category_id, rooms, revenue in room_nights.iterator()}
+
+
+def rebuild_daily_stats():
+    expected = get_expected_daily_stats()
+    with transaction.atomic():
+        DailyStat.objects.all().delete()
+        DailyStat.objects.bulk_create(
+            [DailyStat(day=day, category_id=category_id, occupied_rooms=rooms, revenue=revenue) for (day, category_id), (rooms, revenue) in expected.items()],
+            batch_size=500
+        )
+    return len(expected)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds daily occupancy and revenue stats from room nights, or only verifies them with --verify'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only compare the stats with room nights and fail on differences')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            expected = get_expected_daily_stats()
+            actual = {
+                (day, category_id): (rooms, revenue)
+                for day, category_id, rooms, revenue in DailyStat.objects.values_list('day', 'category', 'occupied_rooms', 'revenue').iterator()
+                if rooms != 0 or revenue != 0
+            }
+            differences = sorted(key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key))
+            for day, category_id in differences:
+                self.stderr.write("Stats of category {} on {} are {}, expected {}".format(category_id, day, actual.get((day, category_id)), expected.get((day, category_id))))
+            if differences:
+                raise CommandError("Daily stats do not match room nights")
+            self.stdout.write(self.style.SUCCESS("{} daily stats match room nights".format(len(expected))))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt {} daily stats".format(rebuild_daily_stats())))
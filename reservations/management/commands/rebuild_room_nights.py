@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from reservations.models import Room, RoomBooking, RoomNight
+from reservations.pricing import get_category_price
+from reservations.management.commands.rebuild_daily_stats import rebuild_daily_stats
+
+
+def get_expected_room_nights():
+    """
+    Returns room nights derived from room bookings as a dict of (room ID, night) -> booking ID,
+    along with a list of (room ID, night, booking ID) taken already by another booking
+    """
+    expected = {}
+    overlapping = []
+    room_bookings = RoomBooking.objects.order_by('booking_id', 'id').values_list('room_id', 'booking_id', 'booking__start_date', 'booking__end_date')
+    for room_id, booking_id, start_date, end_date in room_bookings.iterator():
+        for day in range((end_date - start_date).days):
+            night = start_date + timedelta(days=day)
+            if (room_id, night) in expected:
+                overlapping.append((room_id, night, booking_id))
+            else:
+                expected[(room_id, night)] = booking_id
+    return expected, overlapping
+
+
+def compare_room_nights(expected):
+    """
+    Returns lists of room nights missing from the table, not backed by any room booking and assigned to a wrong booking
+    """
+    actual = {}
+    for room_id, night, booking_id in RoomNight.objects.values_list('room_id', 'night', 'booking_id').iterator():
+        actual[(room_id, night)] = booking_id
+    missing = [key for key in expected if key not in actual]
+    extra = [key for key in actual if key not in expected]
+    mismatched = [key for key in expected if key in actual and actual[key] != expected[key]]
+    return missing, extra, mismatched
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the room night occupancy table from existing bookings at current prices along with daily stats, or only verifies it with --verify'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only compare the table with bookings and fail on differences')
+
+    def handle(self, *args, **options):
+        expected, overlapping = get_expected_room_nights()
+        for room_id, night, booking_id in overlapping:
+            self.stderr.write("Room {} is booked twice on {}, skipping booking {}".format(room_id, night, booking_id))
+
+        if options['verify']:
+            missing, extra, mismatched = compare_room_nights(expected)
+            for description, keys in [("missing", missing), ("without a booking", extra), ("assigned to a wrong booking", mismatched)]:
+                for room_id, night in sorted(keys):
+                    self.stderr.write("Room {} night {} is {}".format(room_id, night, description))
+            if missing or extra or mismatched:
+                raise CommandError("Room nights do not match bookings")
+            self.stdout.write(self.style.SUCCESS("{} room nights match bookings".format(len(expected))))
+            return
+
+        rates = {room_id: get_category_price(category_id) for room_id, category_id in Room.objects.values_list('id', 'category')}
+        with transaction.atomic():
+            RoomNight.objects.all().delete()
+            RoomNight.objects.bulk_create(
+                [RoomNight(room_id=room_id, night=night, booking_id=booking_id, rate=rates[room_id]) for (room_id, night), booking_id in expected.items()],
+                batch_size=500
+            )
+            rebuild_daily_stats()
+        self.stdout.write(self.style.SUCCESS("Rebuilt {} room nights".format(len(expected))))
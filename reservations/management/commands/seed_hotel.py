@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.seeding import HotelSeeder
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a synthetic hotel of rooms and non-overlapping single and multi-room bookings, use a scratch database (see SQLITE_PATH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=2000, help='Number of rooms to add, 0 books existing rooms')
+        parser.add_argument('--bookings', type=int, default=100000, help='Number of bookings to add')
+        parser.add_argument('--categories', type=int, default=5, help='Number of room categories')
+        parser.add_argument('--density', type=float, default=0.7, help='Share of room nights occupied within the booked period')
+        parser.add_argument('--multi-room-ratio', type=float, default=0.2, help='Share of groups of rooms booked together')
+        parser.add_argument('--max-rooms-per-booking', type=int, default=3, help='Maximum number of rooms of a booking')
+        parser.add_argument('--max-nights', type=int, default=7, help='Maximum number of nights of a booking')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of bookings written in a single transaction')
+        parser.add_argument('--seed', type=int, help='Seed of the random generator, for repeatable datasets')
+
+    def handle(self, *args, **options):
+        try:
+            seeder = HotelSeeder(
+                rooms=options['rooms'],
+                bookings=options['bookings'],
+                categories=options['categories'],
+                density=options['density'],
+                multi_room_ratio=options['multi_room_ratio'],
+                max_rooms_per_booking=options['max_rooms_per_booking'],
+                max_nights=options['max_nights'],
+                batch_size=options['batch_size'],
+                seed=options['seed']
+            )
+            start = time.perf_counter()
+            created = seeder.run(log=self.stderr.write if options['verbosity'] > 1 else None)
+        except ValueError as err:
+            raise CommandError(str(err))
+        self.stdout.write(self.style.SUCCESS("Created {bookings} bookings with {room_nights} room nights of {rooms} rooms over {days} days".format(**created)
+                                             + " in {:.1f} s".format(time.perf_counter() - start)))
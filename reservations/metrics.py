@@ -0,0 +1,180 @@
+from collections import deque
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# name, help and the request measurement of every metric reported for each view
+METRICS = [
+    ('request_duration_seconds', 'Wall time of requests', 'duration'),
+    ('db_queries', 'Number of database queries of requests', 'queries'),
+    ('db_duration_seconds', 'Time of database queries of requests', 'db_duration'),
+    ('serialization_duration_seconds', 'Time of serializing objects of requests into response data', 'serialization_duration'),
+    ('rendering_duration_seconds', 'Time of rendering response data of requests as JSON', 'rendering_duration'),
+]
+
+# serialization time of the request served by the current thread, set up by the metrics middleware
+_current_request = threading.local()
+
+
+class RequestMetrics:
+    """
+    Rolling windows of measurements of the latest requests of every view, kept by the process serving them.
+    Quantiles are computed from the windows when they are reported, while sums and counts cover all requests.
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view_name, measurements):
+        with self.lock:
+            view = self.views.get(view_name)
+            if view is None:
+                view = self.views[view_name] = {
+                    'count': 0,
+                    'sums': dict((measurement, 0) for name, help, measurement in METRICS),
+                    'windows': dict((measurement, deque(maxlen=self.window)) for name, help, measurement in METRICS),
+                }
+            view['count'] += 1
+            for name, help, measurement in METRICS:
+                view['sums'][measurement] += measurements[measurement]
+                view['windows'][measurement].append(measurements[measurement])
+
+    def get_quantiles(self, values):
+        values = sorted(values)
+        return [(quantile, values[min(int(quantile * len(values)), len(values) - 1)]) for quantile in QUANTILES]
+
+    def render(self, counters=()):
+        """
+        Returns the metrics in the Prometheus text format as summaries labelled with view names,
+        followed by counters given as (name, help, value)
+        """
+        with self.lock:
+            views = [(view_name, view['count'], dict(view['sums']), dict((key, list(values)) for key, values in view['windows'].items()))
+                     for view_name, view in sorted(self.views.items())]
+        lines = []
+        for name, help, measurement in METRICS:
+            lines.append('# HELP hotel_{} {}'.format(name, help))
+            lines.append('# TYPE hotel_{} summary'.format(name))
+            for view_name, count, sums, windows in views:
+                for quantile, value in self.get_quantiles(windows[measurement]):
+                    lines.append('hotel_{}{{view="{}",quantile="{}"}} {}'.format(name, view_name, quantile, value))
+                lines.append('hotel_{}_sum{{view="{}"}} {}'.format(name, view_name, sums[measurement]))
+                lines.append('hotel_{}_count{{view="{}"}} {}'.format(name, view_name, count))
+        for name, help, value in counters:
+            lines.append('# HELP hotel_{} {}'.format(name, help))
+            lines.append('# TYPE hotel_{} counter'.format(name))
+            lines.append('hotel_{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+request_metrics = RequestMetrics(getattr(settings, 'METRICS_WINDOW', 1000))
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent on building data of a serializer, including its method fields, to the request being measured.
+    Serializers listing objects should set list_serializer_class = TimedListSerializer in their Meta.
+    """
+    @property
+    def data(self):
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            if hasattr(_current_request, 'serialization_duration'):
+                _current_request.serialization_duration += time.perf_counter() - start
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSON renderer adding the time spent on rendering to the request, for the metrics middleware
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            request = (renderer_context or {}).get('request')
+            if request is not None:
+                request = getattr(request, '_request', request)
+                request.rendering_duration = getattr(request, 'rendering_duration', 0) + time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Measures wall time, database queries and their time, and serialization and rendering times of every request,
+    records them per view (e.g. BookingList.post), adds them to the Server-Timing header
+    and logs queries slower than METRICS_SLOW_QUERY_MS milliseconds.
+    Queries are collected the way DEBUG does it, by forcing the debug cursor on every connection for the time of the request.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        forced = [(connection, connection.force_debug_cursor, len(connection.queries_log)) for connection in connections.all()]
+        for connection, force_debug_cursor, start in forced:
+            connection.force_debug_cursor = True
+        _current_request.serialization_duration = 0
+        start_time = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start_time
+            serialization_duration = _current_request.serialization_duration
+            del _current_request.serialization_duration
+            queries = []
+            for connection, force_debug_cursor, start in forced:
+                queries.extend(list(connection.queries_log)[start:])
+                connection.force_debug_cursor = force_debug_cursor
+                if not force_debug_cursor and not settings.DEBUG:
+                    # nobody else is collecting queries of the connection
+                    connection.queries_log.clear()
+
+        measurements = {
+            'duration': duration,
+            'queries': len(queries),
+            'db_duration': sum(float(query['time']) for query in queries),
+            'serialization_duration': serialization_duration,
+            'rendering_duration': getattr(request, 'rendering_duration', 0),
+        }
+        view_name = getattr(request, 'metrics_view_name', 'unresolved')
+        request_metrics.record(view_name, measurements)
+        self.log_slow_queries(view_name, queries)
+
+        response['Server-Timing'] = 'total;dur={:.1f}, db;dur={:.1f};desc="{} queries", serialization;dur={:.1f}, render;dur={:.1f}'.format(
+            measurements['duration'] * 1000, measurements['db_duration'] * 1000, measurements['queries'],
+            measurements['serialization_duration'] * 1000, measurements['rendering_duration'] * 1000
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        view_name = view_class.__name__ if view_class is not None else view_func.__name__
+        request.metrics_view_name = '{}.{}'.format(view_name, request.method.lower())
+
+    def log_slow_queries(self, view_name, queries):
+        threshold = getattr(settings, 'METRICS_SLOW_QUERY_MS', 100)
+        if threshold is None:
+            return
+        slow_queries = sorted((query for query in queries if float(query['time']) * 1000 >= threshold), key=lambda query: -float(query['time']))
+        for query in slow_queries[:getattr(settings, 'METRICS_SLOW_QUERY_LIMIT', 5)]:
+            logger.warning('Slow query of %s took %.0f ms: %s', view_name, float(query['time']) * 1000, query['sql'])
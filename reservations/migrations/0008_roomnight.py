@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2026-10-18 04:17
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_room_nights(apps, schema_editor):
+    """
+    Fills in nights of existing room bookings, nights already taken by an earlier booking are skipped
+    """
+    RoomBooking = apps.get_model('reservations', 'RoomBooking')
+    RoomNight = apps.get_model('reservations', 'RoomNight')
+    taken = set()
+    room_nights = []
+    for room_booking in RoomBooking.objects.select_related('booking').order_by('booking_id', 'id'):
+        booking = room_booking.booking
+        for day in range((booking.end_date - booking.start_date).days):
+            night = booking.start_date + timedelta(days=day)
+            if (room_booking.room_id, night) not in taken:
+                taken.add((room_booking.room_id, night))
+                room_nights.append(RoomNight(room_id=room_booking.room_id, booking_id=booking.id, night=night))
+    RoomNight.objects.bulk_create(room_nights, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0007_auto_20211208_1305'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservations.Booking')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservations.Room')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='roomnight',
+            unique_together=set([('room', 'night')]),
+        ),
+        migrations.RunPython(create_room_nights, migrations.RunPython.noop),
+    ]
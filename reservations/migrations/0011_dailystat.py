@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2026-10-18 04:29
+from __future__ import unicode_literals
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_daily_stats(apps, schema_editor):
+    """
+    Sets rates of existing room nights to current category prices and builds daily stats from them
+    """
+    RoomCategory = apps.get_model('reservations', 'RoomCategory')
+    RoomNight = apps.get_model('reservations', 'RoomNight')
+    DailyStat = apps.get_model('reservations', 'DailyStat')
+    for category in RoomCategory.objects.all():
+        RoomNight.objects.filter(room__category=category).update(rate=category.price)
+    room_nights = RoomNight.objects.values_list('night', 'room__category').annotate(rooms=Count('id'), revenue=Sum('rate')).order_by()
+    DailyStat.objects.bulk_create([
+        DailyStat(day=night, category_id=category_id, occupied_rooms=rooms, revenue=revenue) for night, category_id, rooms, revenue in room_nights
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0010_booking_start_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomnight',
+            name='rate',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+        ),
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('occupied_rooms', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservations.RoomCategory')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailystat',
+            unique_together=set([('day', 'category')]),
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2026-10-18 06:02
+from __future__ import unicode_literals
+
+import re
+
+from django.db import migrations, models
+
+
+def parse_room_ids(room_ids):
+    return [int(room_id) for room_id in re.split(r'[,; ]+', room_ids or '') if room_id.isdigit()]
+
+
+def reconcile_room_bookings(apps, schema_editor):
+    """
+    Makes room bookings the only record of booked rooms before room_ids is dropped.
+    Bookings without room bookings get them from room_ids, other differences are reported and room bookings are kept.
+    """
+    Booking = apps.get_model('reservations', 'Booking')
+    Room = apps.get_model('reservations', 'Room')
+    RoomBooking = apps.get_model('reservations', 'RoomBooking')
+    booked = {}
+    for booking_id, room_id in RoomBooking.objects.order_by('id').values_list('booking_id', 'room_id').iterator():
+        booked.setdefault(booking_id, []).append(room_id)
+    room_ids = set(Room.objects.values_list('id', flat=True))
+
+    created = []
+    mismatches = []
+    for booking_id, stored in Booking.objects.order_by('id').values_list('id', 'room_ids').iterator():
+        stored_ids = parse_room_ids(stored)
+        if booking_id not in booked:
+            existing = [room_id for room_id in stored_ids if room_id in room_ids]
+            missing = [str(room_id) for room_id in stored_ids if room_id not in room_ids]
+            created.extend(RoomBooking(room_id=room_id, booking_id=booking_id) for room_id in existing)
+            if existing:
+                mismatches.append("Booking {}: room bookings created from room_ids {}".format(booking_id, stored))
+            if missing:
+                mismatches.append("Booking {}: rooms {} of room_ids {} do not exist".format(booking_id, ",".join(missing), stored))
+            if not existing:
+                mismatches.append("Booking {}: has no rooms".format(booking_id))
+        elif sorted(stored_ids) != sorted(booked[booking_id]):
+            mismatches.append("Booking {}: room_ids {} differ from room bookings {}, room bookings are kept".format(
+                booking_id, stored, ",".join(str(room_id) for room_id in booked[booking_id])))
+    RoomBooking.objects.bulk_create(created, batch_size=500)
+
+    if mismatches:
+        print("\n  {} mismatches between room_ids and room bookings:".format(len(mismatches)))
+        for mismatch in mismatches:
+            print("    " + mismatch)
+        if created:
+            print("  Run rebuild_room_nights to add nights of the created room bookings")
+
+
+def restore_room_ids(apps, schema_editor):
+    Booking = apps.get_model('reservations', 'Booking')
+    RoomBooking = apps.get_model('reservations', 'RoomBooking')
+    booked = {}
+    for booking_id, room_id in RoomBooking.objects.order_by('id').values_list('booking_id', 'room_id').iterator():
+        booked.setdefault(booking_id, []).append(str(room_id))
+    for booking_id, room_ids in booked.items():
+        Booking.objects.filter(id=booking_id).update(room_ids=",".join(room_ids)[:100])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0012_booking_cost_decimal'),
+    ]
+
+    operations = [
+        # a default lets the column be added back when the migration is reversed
+        migrations.AlterField(
+            model_name='booking',
+            name='room_ids',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.RunPython(reconcile_room_bookings, restore_room_ids),
+        migrations.RemoveField(
+            model_name='booking',
+            name='room_ids',
+        ),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Prefetch, Count, Sum, F, Q, Case, When, Value
 from django.core.validators import MinValueValidator
 from decimal import *
-from datetime import datetime
+from datetime import date, timedelta
 from functools import reduce
 
+from reservations.parsing import parse_date
+
 class RoomCategory(models.Model):
     id = models.CharField(primary_key=True, max_length=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
@@ -23,20 +26,27 @@ class Room(models.Model):
         Checks if the room is available for a given time period
         Excludes booking given in an optional parameter
         """
-        room_bookings = RoomBooking.objects.filter(room__id=self.id, booking__end_date__gt=start_date, booking__start_date__lt=end_date)
+        return not Room.get_conflicting_room_ids([self], start_date, end_date, booking_id)
+
+    def get_conflicting_room_ids(rooms, start_date, end_date, booking_id=None):
+        """
+        Returns a set of IDs of rooms that are booked within the [start_date, end_date) period
+        Runs a single query for all rooms on the room night index, excludes booking given in an optional parameter
+        """
+        room_ids = [room.id if isinstance(room, Room) else int(room) for room in rooms]
+        if not room_ids:
+            return set()
+        room_nights = RoomNight.objects.filter(room__in=room_ids, night__gte=start_date, night__lt=end_date)
         if booking_id is not None:
-            room_bookings = room_bookings.exclude(booking__id=booking_id)
-        return False if len(room_bookings) > 0 else True
+            room_nights = room_nights.exclude(booking=booking_id)
+        return set(room_nights.values_list('room_id', flat=True).distinct())
 
     def check_rooms_availability(rooms, start_date, end_date, booking_id=None):
         """
         Checks if rooms are available for a given time period
         Excludes booking given in an optional parameter
         """
-        for room in rooms:
-            if not room.is_available(start_date, end_date, booking_id):
-                return False
-        return True
+        return not Room.get_conflicting_room_ids(rooms, start_date, end_date, booking_id)
 
     def check_rooms_capacity(rooms, people):
         """
@@ -47,9 +57,10 @@ class Room(models.Model):
 
     def get_cost(self):
         """
-        Returns a cost of a single day in the room
+        Returns a cost of a single day in the room, read from the category price cache
         """
-        return RoomCategory.objects.get(pk=self.category).price
+        from reservations.pricing import get_category_price
+        return get_category_price(self.category_id)
 
     def calculate_cost(rooms, days):
         """
@@ -62,40 +73,266 @@ class Booking(models.Model):
     end_date = models.DateField()
     name = models.CharField(max_length=100)
     surname = models.CharField(max_length=100)
-    room_ids = models.CharField(max_length=100)
     number_of_people = models.PositiveIntegerField(validators=[MinValueValidator(1)]) 
-    cost = models.PositiveIntegerField()
+    cost = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='booking_start_end_idx'),
+            models.Index(fields=['start_date', 'id'], name='booking_start_id_idx'),
+            models.Index(fields=['end_date', 'start_date'], name='booking_end_start_idx'),
+            models.Index(fields=['surname', 'name'], name='booking_surname_name_idx'),
+            models.Index(fields=['name'], name='booking_name_idx'),
+            models.Index(fields=['number_of_people'], name='booking_people_idx'),
+            models.Index(fields=['cost'], name='booking_cost_idx'),
+        ]
     def __str__(self):
         return self.name + " " + self.surname
             
     def is_date_range_correct(start_date, end_date):
-        start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-        return True if start_date >= datetime.today().date() and end_date > start_date else False
+        """
+        Checks that a stay given with dates or YYYY-MM-DD strings starts today or later and lasts at least a night
+        """
+        start_date, end_date = parse_date(start_date), parse_date(end_date)
+        return start_date >= date.today() and end_date > start_date
 
     def create_room_bookings(self, rooms):
-        for room in rooms:
-            room_booking = RoomBooking(room=room, booking=self)
-            room_booking.save()
+        """
+        Creates room bookings along with the nights they occupy
+        Raises IntegrityError if any of the nights has been taken in the meantime
+        """
+        room_bookings = RoomBooking.objects.bulk_create([RoomBooking(room=room, booking=self) for room in rooms])
+        # rooms of the booking are known now, serializing it doesn't need to fetch them again
+        self.prefetched_room_bookings = room_bookings
+        room_nights = self.build_room_nights(rooms)
+        RoomNight.objects.bulk_create(room_nights)
+        DailyStat.add_room_nights(room_nights)
+
+    def build_room_nights(self, rooms, engine=None):
+        """
+        Returns unsaved room nights of the booking with rates of the quote engine
+        An engine shared by many bookings can be passed in an optional parameter
+        """
+        from reservations.pricing import QuoteEngine
+        if engine is None:
+            engine = QuoteEngine.for_stays([(rooms, self.start_date, self.end_date)])
+        nights = self.get_nights()
+        rates = engine.matrix(rooms, self.start_date, self.end_date)
+        return [RoomNight(room=room, booking=self, night=night, rate=rate) for room, room_rates in zip(rooms, rates) for night, rate in zip(nights, room_rates)]
 
-    def validate_booking_data(booking_data, rooms, booking_id=None):
-        if not Booking.is_date_range_correct(booking_data["start_date"], booking_data["end_date"]):
+    def update_room_bookings(self, rooms):
+        """
+        Brings room bookings and room nights in line with the given rooms and the current dates of the booking,
+        touching only rows that changed: nights no longer booked are deleted, new ones are inserted
+        and kept ones are repriced only if their rate changed. Runs a fixed number of queries.
+        Raises IntegrityError if any of the new nights has been taken in the meantime
+        """
+        from reservations.pricing import QuoteEngine
+        old_room_ids = self.get_room_ids()
+        room_ids = set(room.id for room in rooms)
+        rooms_by_id = {room.id: room for room in rooms}
+        removed_room_ids = [room_id for room_id in old_room_ids if room_id not in room_ids]
+        added_rooms = [room for room in rooms if room.id not in set(old_room_ids)]
+
+        engine = QuoteEngine.for_stays([(rooms, self.start_date, self.end_date)])
+        nights = self.get_nights()
+        booked = {
+            (room.id, night): rate
+            for room, room_rates in zip(rooms, engine.matrix(rooms, self.start_date, self.end_date))
+            for night, rate in zip(nights, room_rates)
+        }
+        old_nights = RoomNight.objects.filter(booking=self.id).values_list('id', 'room_id', 'room__category', 'night', 'rate')
+
+        changes = {}
+        def change(night, category_id, rooms, revenue):
+            old_rooms, old_revenue = changes.get((night, category_id), (0, 0))
+            changes[(night, category_id)] = (old_rooms + rooms, old_revenue + revenue)
+
+        kept = set()
+        repriced = {}
+        left = False
+        for night_id, room_id, category_id, night, rate in old_nights:
+            if (room_id, night) not in booked:
+                left = True
+                change(night, category_id, -1, -rate)
+                continue
+            kept.add((room_id, night))
+            new_rate = booked[(room_id, night)]
+            if new_rate != rate:
+                repriced.setdefault(new_rate, []).append(night_id)
+                change(night, category_id, 0, new_rate - rate)
+
+        if left:
+            RoomNight.objects.filter(booking=self.id).filter(
+                Q(room__in=removed_room_ids) | Q(night__lt=self.start_date) | Q(night__gte=self.end_date)
+            ).delete()
+        if repriced:
+            night_ids = [night_id for ids in repriced.values() for night_id in ids]
+            RoomNight.objects.filter(id__in=night_ids).update(
+                rate=Case(*[When(id__in=ids, then=Value(rate)) for rate, ids in repriced.items()], output_field=models.DecimalField(max_digits=10, decimal_places=2))
+            )
+        new_nights = [
+            RoomNight(room=rooms_by_id[room_id], booking=self, night=night, rate=rate)
+            for (room_id, night), rate in booked.items() if (room_id, night) not in kept
+        ]
+        RoomNight.objects.bulk_create(new_nights)
+        for room_night in new_nights:
+            change(room_night.night, room_night.room.category_id, 1, room_night.rate)
+
+        if removed_room_ids:
+            RoomBooking.objects.filter(booking=self.id, room__in=removed_room_ids).delete()
+        added_room_bookings = RoomBooking.objects.bulk_create([RoomBooking(room=room, booking=self) for room in added_rooms])
+        DailyStat.apply_changes(changes)
+        self.prefetched_room_bookings = [
+            RoomBooking(room=rooms_by_id[room_id], booking=self) for room_id in old_room_ids if room_id in room_ids
+        ] + added_room_bookings
+
+    def validate_booking_data(booking_request, rooms, booking_id=None):
+        """
+        Checks dates, availability and capacity of rooms of a parsed BookingRequest
+        """
+        if not Booking.is_date_range_correct(booking_request.start_date, booking_request.end_date):
             raise Exception("Incorrect date range")
-        if not Room.check_rooms_availability(rooms, booking_data["start_date"], booking_data["end_date"], booking_id):
-            raise Exception("Rooms booked already for given date range")
-        if not Room.check_rooms_capacity(rooms, booking_data["number_of_people"]):
+        conflicting_room_ids = Room.get_conflicting_room_ids(rooms, booking_request.start_date, booking_request.end_date, booking_id)
+        if conflicting_room_ids:
+            raise Exception("Rooms booked already for given date range: " + ", ".join(str(room_id) for room_id in sorted(conflicting_room_ids)))
+        if not Room.check_rooms_capacity(rooms, booking_request.number_of_people):
             raise Exception("Rooms have insufficient capacity")
         return True
 
+    def prefetch_room_bookings(queryset):
+        """
+        Fetches room bookings together with their rooms for all bookings of the queryset in a single query
+        """
+        room_bookings = RoomBooking.objects.select_related('room').order_by('id')
+        return queryset.prefetch_related(Prefetch('roombooking_set', queryset=room_bookings, to_attr='prefetched_room_bookings'))
+
+    def get_room_ids(self):
+        if hasattr(self, 'prefetched_room_bookings'):
+            return [room_booking.room_id for room_booking in self.prefetched_room_bookings]
+        return list(RoomBooking.objects.filter(booking=self.id).order_by('id').values_list('room_id', flat=True))
+
     def get_room_numbers(self):
-        return [room_booking.room.number for room_booking in RoomBooking.objects.filter(booking=self.id)]
+        if hasattr(self, 'prefetched_room_bookings'):
+            return [room_booking.room.number for room_booking in self.prefetched_room_bookings]
+        return list(RoomBooking.objects.filter(booking=self.id).order_by('id').values_list('room__number', flat=True))
 
     def get_duration(self):
         return (self.end_date - self.start_date).days
 
+    def get_nights(self):
+        return [self.start_date + timedelta(days=day) for day in range(self.get_duration())]
+
 
 class RoomBooking(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE)
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'booking'], name='roombooking_room_booking_idx'),
+        ]
     def __str__(self):
-        return str(self.room) + str(self.booking)
\ No newline at end of file
+        return str(self.room) + str(self.booking)
+
+class RoomNight(models.Model):
+    """
+    A single night of a room taken by a booking, the occupancy table used for conflict checks and occupancy counts
+    The unique index on room and night guarantees that a room can't be booked twice, even by concurrent requests
+    Use the rebuild_room_nights command to rebuild the table from existing bookings or to verify it
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE)
+    night = models.DateField()
+    rate = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(Decimal('0.00'))])
+    class Meta:
+        unique_together = ('room', 'night')
+        indexes = [
+            models.Index(fields=['night'], name='roomnight_night_idx'),
+        ]
+    def __str__(self):
+        return str(self.room) + " " + str(self.night)
+
+    def get_occupancy(start_date, end_date):
+        """
+        Returns a number of rooms taken on every night of the [start_date, end_date) period
+        """
+        room_nights = RoomNight.objects.filter(night__gte=start_date, night__lt=end_date)
+        return dict(room_nights.values_list('night').annotate(rooms=Count('id')).order_by('night'))
+
+
+class DailyStat(models.Model):
+    """
+    Daily rollup of occupied rooms and revenue per room category, updated on every change of room nights
+    Use the rebuild_daily_stats command to rebuild it from room nights
+    """
+    day = models.DateField()
+    category = models.ForeignKey(RoomCategory, on_delete=models.CASCADE)
+    occupied_rooms = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    class Meta:
+        unique_together = ('day', 'category')
+    def __str__(self):
+        return str(self.day) + " " + str(self.category_id)
+
+    def apply_changes(changes):
+        """
+        Adds numbers of rooms and revenue given in a dict of (day, category ID) -> (rooms, revenue) to the rollup.
+        Missing rows are created first, then all of them are changed with a single update,
+        so the number of queries does not depend on the number of nights or rooms.
+        """
+        changes = {key: change for key, change in changes.items() if change != (0, 0)}
+        if not changes:
+            return
+        days = set(day for day, category_id in changes)
+        category_ids = set(category_id for day, category_id in changes)
+        existing = set(DailyStat.objects.filter(day__in=days, category__in=category_ids).values_list('day', 'category'))
+        missing = [key for key in changes if key not in existing]
+        if missing:
+            try:
+                with transaction.atomic():
+                    DailyStat.objects.bulk_create([DailyStat(day=day, category_id=category_id) for day, category_id in missing])
+            except IntegrityError:
+                # some of them created by a concurrent request in the meantime
+                for day, category_id in missing:
+                    DailyStat.objects.get_or_create(day=day, category_id=category_id)
+
+        # days of a category with the same change are matched together, usually that is a single condition per category
+        grouped = {}
+        for (day, category_id), change in changes.items():
+            grouped.setdefault((category_id, change), []).append(day)
+        conditions = [(Q(category=category_id, day__in=days), change) for (category_id, change), days in grouped.items()]
+        DailyStat.objects.filter(day__in=days, category__in=category_ids).update(
+            occupied_rooms=F('occupied_rooms') + Case(*[When(condition, then=Value(rooms)) for condition, (rooms, revenue) in conditions], default=Value(0), output_field=models.IntegerField()),
+            revenue=F('revenue') + Case(*[When(condition, then=Value(revenue)) for condition, (rooms, revenue) in conditions], default=Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )
+
+    def add_room_nights(room_nights):
+        changes = {}
+        for room_night in room_nights:
+            key = (room_night.night, room_night.room.category_id)
+            rooms, revenue = changes.get(key, (0, 0))
+            changes[key] = (rooms + 1, revenue + room_night.rate)
+        DailyStat.apply_changes(changes)
+
+    def remove_room_nights(room_nights):
+        """
+        Takes room nights of the queryset, which are about to be deleted, off the rollup
+        """
+        totals = room_nights.values_list('night', 'room__category').annotate(rooms=Count('id'), revenue=Sum('rate')).order_by()
+        DailyStat.apply_changes({(night, category_id): (-rooms, -revenue) for night, category_id, rooms, revenue in totals})
+
+    def remove_booking(booking_id):
+        DailyStat.remove_room_nights(RoomNight.objects.filter(booking=booking_id))
+
+    def remove_room(room_id):
+        DailyStat.remove_room_nights(RoomNight.objects.filter(room=room_id))
+
+    def move_room(room_id, old_category_id, new_category_id):
+        """
+        Moves nights of a room from its old category to the new one
+        """
+        totals = RoomNight.objects.filter(room=room_id).values_list('night').annotate(rooms=Count('id'), revenue=Sum('rate')).order_by()
+        changes = {}
+        for night, rooms, revenue in totals:
+            changes[(night, old_category_id)] = (-rooms, -revenue)
+            changes[(night, new_category_id)] = (rooms, revenue)
+        DailyStat.apply_changes(changes)
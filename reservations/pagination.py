@@ -0,0 +1,109 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination on a unique ordering, e.g. (start_date, id).
+    The cursor holds values of the ordering fields of the last item of the page and the next page starts right after them,
+    so every page is a single indexed range query, however deep it is.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = ordering
+        if page_size is not None:
+            self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        self.next_position = self.get_position(self.page[-1]) if len(results) > self.page_size else None
+        return self.page
+
+    def get_position(self, instance):
+        return [str(getattr(instance, field)) for field in self.ordering]
+
+    def get_position_filter(self, position):
+        """
+        Returns a filter of items following the position, written as (a >= x) AND (a > x OR b > y)
+        so that it stays a range scan on an index of the ordering fields
+        """
+        following = Q(**{self.ordering[-1] + '__gt': position[-1]})
+        for field, value in reversed(list(zip(self.ordering[:-1], position[:-1]))):
+            following = Q(**{field + '__gt': value}) | (Q(**{field: value}) & following)
+        return Q(**{self.ordering[0] + '__gte': position[0]}) & following
+
+    def decode_cursor(self, request, model):
+        """
+        Returns values of the ordering fields held by the cursor of the request, converted by the fields of the model,
+        raises NotFound when the cursor can't be decoded or doesn't hold valid values
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering) or None in position:
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [model._meta.get_field(field).to_python(value) for field, value in zip(self.ordering, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        encoded = b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_position) if self.next_position is not None else None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination, switching to keyset pagination when a request passes pagination=cursor or a cursor
+    """
+    keyset_ordering = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset_paginator = KeysetPagination(self.keyset_ordering, self.page_size)
+            return self.keyset_paginator.paginate_queryset(queryset, request, view)
+        self.keyset_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class BookingPagination(OptionalKeysetPagination):
+    keyset_ordering = ('start_date', 'id')
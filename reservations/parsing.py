@@ -0,0 +1,141 @@
+from collections.abc import Mapping
+from datetime import date
+import re
+
+from django.conf import settings
+
+
+DATE_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})\Z')
+ROOM_ID_SEPARATORS = re.compile(r'[,;\s]+')
+
+
+def parse_date(value):
+    """
+    Returns a date of a YYYY-MM-DD string, or the value itself if it is a date already.
+    Raises ValueError with a message for the client otherwise.
+    """
+    if isinstance(value, date):
+        return value
+    match = DATE_PATTERN.match(value) if isinstance(value, str) else None
+    if match is None:
+        raise ValueError("Incorrect date: {}, use YYYY-MM-DD".format(value))
+    try:
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError as err:
+        raise ValueError("Incorrect date: {}, {}".format(value, err))
+
+
+def parse_integer(value):
+    """
+    Returns an int of an integral number or a string of one. Raises ValueError for anything else,
+    booleans and fractional numbers included, which int() would silently turn into other numbers.
+    """
+    if isinstance(value, bool):
+        raise ValueError("Not an integer: " + str(value))
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value)
+    raise ValueError("Not an integer: " + str(value))
+
+
+def parse_room_ids(room_ids):
+    """
+    Returns a list of room IDs given as a list, a number or a string with IDs separated by commas, semicolons or spaces
+    """
+    if room_ids is None or room_ids == "":
+        raise ValueError("Room IDs are missing")
+    if isinstance(room_ids, str):
+        items = ROOM_ID_SEPARATORS.split(room_ids.strip())
+    elif isinstance(room_ids, (list, tuple)):
+        items = room_ids
+    else:
+        items = [room_ids]
+    try:
+        parsed = [parse_integer(room_id) for room_id in items]
+    except ValueError:
+        raise ValueError("Incorrect room IDs: " + str(room_ids))
+    if len(set(parsed)) != len(parsed):
+        raise ValueError("Duplicate room IDs: " + str(room_ids))
+    return parsed
+
+
+def check_stay_length(start_date, end_date):
+    """
+    Raises ValueError with a message for the client when a stay lasts longer than MAX_STAY_NIGHTS nights.
+    Every night of a stay is written as room nights and daily stats, so the limit bounds the work of a single request.
+    """
+    max_nights = getattr(settings, 'MAX_STAY_NIGHTS', 365)
+    if max_nights is not None and (end_date - start_date).days > max_nights:
+        raise ValueError("Stays are limited to {} nights".format(max_nights))
+
+
+class BookingRequest:
+    """
+    Booking payload parsed once into typed values: dates, room IDs as a tuple of ints, the number of people and the guest.
+    Validation, pricing and saving all read this object instead of parsing strings of the request again.
+    Instances use slots and are immutable.
+    """
+    __slots__ = ('start_date', 'end_date', 'room_ids', 'number_of_people', 'name', 'surname')
+
+    def __init__(self, start_date, end_date, room_ids, number_of_people, name=None, surname=None):
+        for field, value in zip(self.__slots__, (start_date, end_date, tuple(room_ids), number_of_people, name, surname)):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BookingRequest is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("BookingRequest is immutable")
+
+    def __repr__(self):
+        return "BookingRequest({})".format(", ".join("{}={!r}".format(field, getattr(self, field)) for field in self.__slots__))
+
+    @classmethod
+    def parse(cls, data):
+        """
+        Returns a booking request of a dict or a QueryDict of request data, raises ValueError with a message for the client.
+        The guest name is left to the serializer, which reports missing or too long values per field.
+        """
+        if not isinstance(data, Mapping):
+            raise ValueError("Incorrect request body: expected an object")
+        for field in ('start_date', 'end_date'):
+            if data.get(field) is None:
+                raise ValueError("Missing parameter: " + field)
+        number_of_people = data.get("number_of_people")
+        if number_of_people is None:
+            raise ValueError("Missing parameter: number_of_people")
+        try:
+            number_of_people = parse_integer(number_of_people)
+        except ValueError:
+            raise ValueError("Incorrect number of people: " + str(number_of_people))
+        start_date, end_date = parse_date(data["start_date"]), parse_date(data["end_date"])
+        check_stay_length(start_date, end_date)
+        return cls(
+            start_date,
+            end_date,
+            parse_room_ids(data.get("room_ids")),
+            number_of_people,
+            data.get("name"),
+            data.get("surname")
+        )
+
+    def get_duration(self):
+        return (self.end_date - self.start_date).days
+
+    def get_serializer_data(self, cost):
+        """
+        Returns data of the booking serializer with the given cost
+        """
+        data = {
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "number_of_people": self.number_of_people,
+            "cost": cost,
+        }
+        for field in ('name', 'surname'):
+            if getattr(self, field) is not None:
+                data[field] = getattr(self, field)
+        return data
@@ -0,0 +1,121 @@
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+from itertools import accumulate
+import threading
+import time
+
+from django.conf import settings
+
+from reservations.models import RoomCategory
+
+
+_prices_lock = threading.Lock()
+_prices = None
+_prices_loaded_at = 0
+
+
+def get_category_prices():
+    """
+    Returns a process-wide table of room category prices, reloading it when invalidated or older than CATEGORY_PRICE_TTL seconds.
+    The TTL bounds how long a worker can use prices changed by other processes.
+    """
+    global _prices, _prices_loaded_at
+    ttl = getattr(settings, 'CATEGORY_PRICE_TTL', 300)
+    with _prices_lock:
+        if _prices is None or (ttl is not None and time.monotonic() - _prices_loaded_at > ttl):
+            _prices = dict(RoomCategory.objects.values_list('id', 'price'))
+            _prices_loaded_at = time.monotonic()
+        return _prices
+
+
+def get_category_price(category_id):
+    """
+    Returns a price of a single day in a room of the given category
+    """
+    prices = get_category_prices()
+    if category_id not in prices:
+        # the category may have been created by another process
+        invalidate_category_prices()
+        prices = get_category_prices()
+    return prices[category_id]
+
+
+def invalidate_category_prices():
+    global _prices
+    with _prices_lock:
+        _prices = None
+
+
+def get_night_rates(category_ids, start_date, end_date):
+    """
+    Returns a dict of category ID -> list of rates of every night of the [start_date, end_date) period.
+    Every night costs the category price, seasonal or weekday rates only need to change this function.
+    """
+    nights = (end_date - start_date).days
+    return {category_id: [get_category_price(category_id)] * nights for category_id in category_ids}
+
+
+class QuoteEngine:
+    """
+    Prices many stays at once as matrices of per-room per-night rates.
+    Stays are merged into periods of overlapping or adjacent nights, and rates of every category are laid out in an array
+    covering all nights of a period along with its prefix sums, so the cost of a stay takes one subtraction per room category,
+    however long it is. Nights between periods are not priced, so stays far apart cost no more than the nights they cover.
+    """
+    def __init__(self, category_ids, periods):
+        self.periods = []
+        for start_date, end_date in periods:
+            rates = get_night_rates(category_ids, start_date, end_date)
+            prefix_sums = {category_id: [Decimal('0.00')] + list(accumulate(category_rates)) for category_id, category_rates in rates.items()}
+            self.periods.append((start_date, end_date, rates, prefix_sums))
+        self.starts = [start_date for start_date, end_date, rates, prefix_sums in self.periods]
+
+    def for_stays(stays):
+        """
+        Returns an engine able to price all stays given as (rooms, start date, end date)
+        """
+        category_ids = set(room.category_id for rooms, start_date, end_date in stays for room in rooms)
+        periods = []
+        for start_date, end_date in sorted(set((start_date, end_date) for rooms, start_date, end_date in stays)):
+            if periods and start_date <= periods[-1][1]:
+                periods[-1][1] = max(periods[-1][1], end_date)
+            else:
+                periods.append([start_date, end_date])
+        return QuoteEngine(category_ids, periods)
+
+    def get_offsets(self, start_date, end_date):
+        """
+        Returns rates and prefix sums of the period covering the stay, along with offsets of the stay within the period
+        """
+        position = bisect_right(self.starts, start_date) - 1
+        if position < 0 or end_date > self.periods[position][1]:
+            raise ValueError("Stay out of the priced period")
+        period_start, period_end, rates, prefix_sums = self.periods[position]
+        return rates, prefix_sums, (start_date - period_start).days, (end_date - period_start).days
+
+    def matrix(self, rooms, start_date, end_date):
+        """
+        Returns rates of every night of the stay for every room, as a list of rows of rooms
+        """
+        rates, prefix_sums, start, end = self.get_offsets(start_date, end_date)
+        return [rates[room.category_id][start:end] for room in rooms]
+
+    def quote(self, rooms, start_date, end_date):
+        """
+        Returns a cost of the stay in the rooms, rooms of the same category are priced together
+        """
+        rates, prefix_sums, start, end = self.get_offsets(start_date, end_date)
+        room_counts = Counter(room.category_id for room in rooms)
+        cost = Decimal('0.00')
+        for category_id, count in room_counts.items():
+            category_prefix_sums = prefix_sums[category_id]
+            cost += (category_prefix_sums[end] - category_prefix_sums[start]) * count
+        return cost
+
+
+def quote_stay(rooms, start_date, end_date):
+    """
+    Returns a cost of a single stay in the rooms
+    """
+    return QuoteEngine.for_stays([(rooms, start_date, end_date)]).quote(rooms, start_date, end_date)
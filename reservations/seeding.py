@@ -0,0 +1,180 @@
+from datetime import datetime, timedelta
+import math
+import random
+import string
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from reservations.models import RoomCategory, Room, Booking, RoomBooking, RoomNight
+from reservations.pricing import QuoteEngine, invalidate_category_prices
+from reservations.availability import invalidate_room_index
+
+
+NAMES = ['Anna', 'Jan', 'Maria', 'Piotr', 'Katarzyna', 'Tomasz', 'Ewa', 'Marek', 'Olga', 'Adam']
+SURNAMES = ['Nowak', 'Kowalski', 'Wisniewska', 'Wojcik', 'Kaminski', 'Lewandowska', 'Zielinski', 'Szymanska']
+
+
+class HotelSeeder:
+    """
+    Generates a synthetic hotel: room categories, rooms and bookings spread over a period starting today.
+    Rooms are split into groups of one up to max_rooms_per_booking rooms, the share of multi-room groups being multi_room_ratio,
+    and every group gets a timeline of stays of all its rooms separated by gaps, so that about density of room nights is occupied.
+    Bookings never overlap on a room, so the data passes the same checks as bookings made through the API.
+    Primary keys are assigned up front, which lets bookings, room bookings and room nights be bulk inserted on every database.
+    """
+    def __init__(self, rooms=2000, bookings=100000, categories=5, density=0.7, multi_room_ratio=0.2,
+                 max_rooms_per_booking=3, max_nights=7, batch_size=5000, seed=None):
+        if not 0 < density <= 1:
+            raise ValueError("Density has to be greater than 0 and at most 1")
+        if not 0 < categories <= len(string.ascii_uppercase):
+            raise ValueError("Number of categories has to be between 1 and {}".format(len(string.ascii_uppercase)))
+        self.rooms = rooms
+        self.bookings = bookings
+        self.categories = categories
+        self.density = density
+        self.multi_room_ratio = multi_room_ratio
+        self.max_rooms_per_booking = max_rooms_per_booking
+        self.max_nights = max_nights
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+
+    def create_rooms(self):
+        """
+        Creates missing categories and rooms, numbered after existing ones, and returns all rooms
+        """
+        for index, category_id in enumerate(string.ascii_uppercase[:self.categories]):
+            RoomCategory.objects.get_or_create(id=category_id, defaults={'name': 'Category ' + category_id, 'price': 100 + 50 * index})
+        category_ids = list(RoomCategory.objects.order_by('id').values_list('id', flat=True))
+        first_number = (Room.objects.aggregate(number=Max('number'))['number'] or 0) + 1
+        Room.objects.bulk_create([
+            Room(number=first_number + i, category_id=self.random.choice(category_ids), capacity=self.random.randint(1, 4))
+            for i in range(self.rooms)
+        ])
+        invalidate_category_prices()
+        return list(Room.objects.order_by('number'))
+
+    def group_rooms(self, rooms):
+        groups = []
+        index = 0
+        while index < len(rooms):
+            size = 1
+            if self.max_rooms_per_booking > 1 and self.random.random() < self.multi_room_ratio:
+                size = self.random.randint(2, self.max_rooms_per_booking)
+            groups.append(rooms[index:index + size])
+            index += size
+        return groups
+
+    def get_days(self, groups):
+        """
+        Returns the length of the period needed for the requested number of bookings at the requested density
+        """
+        average_stay = (1 + self.max_nights) / 2
+        return max(1, math.ceil(self.bookings * average_stay / (len(groups) * self.density)))
+
+    def iterate_stays(self, groups, start_date, days):
+        """
+        Yields (rooms, start date, end date) of stays, visiting groups in turns so that stops at any number of bookings
+        leave stays spread over all rooms
+        """
+        average_stay = (1 + self.max_nights) / 2
+        # gaps make up 1 - density of every timeline on average
+        average_gap = average_stay * (1 - self.density) / self.density
+        positions = [self.random.randint(0, math.ceil(average_gap)) for group in groups]
+        while True:
+            active = False
+            for index, group in enumerate(groups):
+                nights = self.random.randint(1, self.max_nights)
+                if positions[index] + nights > days:
+                    continue
+                active = True
+                stay_start = start_date + timedelta(days=positions[index])
+                yield group, stay_start, stay_start + timedelta(days=nights)
+                positions[index] += nights + (int(self.random.expovariate(1 / average_gap)) if average_gap else 0)
+            if not active:
+                return
+
+    def run(self, log=None):
+        """
+        Creates rooms and bookings, returns numbers of booked rooms, created bookings and room nights and the length of the period.
+        With rooms set to 0 existing rooms are booked.
+        """
+        with transaction.atomic():
+            rooms = self.create_rooms()
+        rooms = rooms[-self.rooms:] if self.rooms else rooms
+        groups = self.group_rooms(rooms)
+        if not groups:
+            raise ValueError("There are no rooms to book")
+        # stays start after all existing bookings, so that they cannot conflict with them
+        start_date = max(datetime.today().date(), Booking.objects.aggregate(end_date=Max('end_date'))['end_date'] or datetime.today().date())
+        days = self.get_days(groups)
+
+        next_ids = [(model.objects.aggregate(id=Max('id'))['id'] or 0) + 1 for model in (Booking, RoomBooking, RoomNight)]
+        created = {'rooms': len(rooms), 'bookings': 0, 'room_nights': 0, 'days': days}
+        batch = []
+        for stay in self.iterate_stays(groups, start_date, days):
+            # the count is checked before a stay is added, so that no booking is created when none is asked for
+            if created['bookings'] + len(batch) >= self.bookings:
+                break
+            batch.append(stay)
+            if len(batch) >= self.batch_size:
+                next_ids = self.write(batch, next_ids, created)
+                batch = []
+                if log is not None:
+                    log("Created {} bookings".format(created['bookings']))
+        if batch:
+            self.write(batch, next_ids, created)
+            if log is not None:
+                log("Created {} bookings".format(created['bookings']))
+
+        self.reset_sequences()
+        # the rollup is rebuilt once instead of being updated by every batch
+        from reservations.management.commands.rebuild_daily_stats import rebuild_daily_stats
+        rebuild_daily_stats()
+        invalidate_room_index()
+        return created
+
+    def write(self, stays, next_ids, created):
+        booking_id, room_booking_id, room_night_id = next_ids
+        engine = QuoteEngine.for_stays(stays)
+        bookings = []
+        room_bookings = []
+        room_nights = []
+        for rooms, start_date, end_date in stays:
+            booking = Booking(
+                id=booking_id,
+                start_date=start_date,
+                end_date=end_date,
+                name=self.random.choice(NAMES),
+                surname=self.random.choice(SURNAMES),
+                number_of_people=self.random.randint(1, max(1, sum(room.capacity for room in rooms))),
+                cost=engine.quote(rooms, start_date, end_date)
+            )
+            booking_id += 1
+            bookings.append(booking)
+            for room in rooms:
+                room_bookings.append(RoomBooking(id=room_booking_id, room=room, booking=booking))
+                room_booking_id += 1
+            for room_night in booking.build_room_nights(rooms, engine):
+                room_night.id = room_night_id
+                room_night_id += 1
+                room_nights.append(room_night)
+
+        with transaction.atomic():
+            Booking.objects.bulk_create(bookings)
+            RoomBooking.objects.bulk_create(room_bookings)
+            RoomNight.objects.bulk_create(room_nights)
+        created['bookings'] += len(bookings)
+        created['room_nights'] += len(room_nights)
+        return booking_id, room_booking_id, room_night_id
+
+    def reset_sequences(self):
+        """
+        Moves primary key sequences past the assigned keys on databases using them
+        """
+        statements = connection.ops.sequence_reset_sql(no_style(), [Booking, RoomBooking, RoomNight])
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
@@ -1,23 +1,32 @@
 from rest_framework import serializers
 from reservations.models import RoomCategory, Room, Booking, RoomBooking
+from reservations.metrics import TimedSerializerMixin, TimedListSerializer
 
-class RoomCategorySerializer(serializers.ModelSerializer):
+class RoomCategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = RoomCategory
         fields = ['id', 'price', 'name']
+        list_serializer_class = TimedListSerializer
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Room
         fields = ['id', 'number', 'category', 'capacity']
+        list_serializer_class = TimedListSerializer
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    room_ids = serializers.SerializerMethodField()
     room_numbers = serializers.SerializerMethodField()
     duration = serializers.SerializerMethodField()
+    cost = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, coerce_to_string=False)
 
     class Meta:
         model = Booking
         fields = ['start_date', 'end_date', 'name', 'surname', 'number_of_people', 'cost', 'room_ids', 'room_numbers', 'id', 'duration']
+        list_serializer_class = TimedListSerializer
+
+    def get_room_ids(self, obj):
+        return ",".join(str(room_id) for room_id in obj.get_room_ids())
 
     def get_room_numbers(self, obj):
         return obj.get_room_numbers()
@@ -38,17 +47,17 @@ class BookingSerializer(serializers.ModelSerializer):
         instance.surname = validated_data["surname"]
         instance.number_of_people = validated_data["number_of_people"]
         instance.cost = validated_data["cost"]
-        instance.room_ids = validated_data["room_ids"]
-        
-        if "rooms" in validated_data:
-            rooms = validated_data.pop("rooms")
-            room_bookings = RoomBooking.objects.filter(booking__id=instance.id).delete()
-            instance.create_room_bookings(rooms)
 
+        # rooms are passed only when they or the dates changed
+        if validated_data.get("rooms") is not None:
+            instance.update_room_bookings(validated_data.pop("rooms"))
+
+        # saving the booking drops its cached data, see reservations/signals.py
         instance.save()
         return instance
 
-class RoomBookingSerializer(serializers.ModelSerializer):
+class RoomBookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = RoomBooking
+        list_serializer_class = TimedListSerializer
         fields = ['room', 'booking']
\ No newline at end of file
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.dispatch import receiver
+
+from reservations.models import RoomCategory, Room, Booking, RoomBooking, DailyStat
+from reservations.availability import invalidate_room_index
+from reservations.caching import bump_cache_version, invalidate_cached_booking
+from reservations.pricing import invalidate_category_prices
+
+
+@receiver([post_save, post_delete], sender=Booking)
+@receiver([post_save, post_delete], sender=RoomBooking)
+def booking_changed(sender, **kwargs):
+    """
+    Drops the cached room availability index whenever bookings change.
+    Room bookings are bulk created without signals after the booking is saved, so the index is dropped once more
+    when the transaction commits, an index rebuilt by another thread in the meantime would miss them.
+    """
+    invalidate_room_index()
+    transaction.on_commit(invalidate_room_index)
+
+
+@receiver([post_save, post_delete], sender=RoomCategory)
+def room_category_changed(sender, **kwargs):
+    """
+    Drops the cached category prices and responses of category views whenever a category is written, including through the admin
+    """
+    invalidate_category_prices()
+    bump_cache_version('room_categories')
+
+
+@receiver([post_save, post_delete], sender=Room)
+def room_changed(sender, **kwargs):
+    """
+    Drops cached responses of room views whenever a room is written
+    """
+    bump_cache_version('rooms')
+
+
+@receiver(pre_save, sender=Room)
+def room_saved(sender, instance, raw=False, **kwargs):
+    """
+    Moves nights of a room to its new category in daily stats when the category of the room changes
+    """
+    if raw or instance.pk is None:
+        return
+    old_category_id = Room.objects.filter(pk=instance.pk).values_list('category', flat=True).first()
+    if old_category_id is not None and old_category_id != instance.category_id:
+        DailyStat.move_room(instance.pk, old_category_id, instance.category_id)
+
+
+@receiver(pre_delete, sender=Room)
+def room_deleted(sender, instance, **kwargs):
+    """
+    Removes nights of a deleted room from daily stats before they are deleted along with it
+    """
+    DailyStat.remove_room(instance.id)
+
+
+@receiver(pre_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    """
+    Removes nights of a deleted booking from daily stats before they are deleted along with it
+    """
+    DailyStat.remove_booking(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_written(sender, instance, **kwargs):
+    """
+    Drops the cached data of a booking whenever it is saved or deleted, including through the admin
+    """
+    invalidate_cached_booking(instance.id)
+
+
+@receiver([post_save, post_delete], sender=RoomBooking)
+def room_booking_written(sender, instance, **kwargs):
+    """
+    Drops the cached data of a booking whenever one of its room bookings is saved or deleted one by one, e.g. through the admin
+    """
+    invalidate_cached_booking(instance.booking_id)
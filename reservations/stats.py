@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count
+
+from reservations.models import Room, DailyStat
+
+
+GROUPINGS = ('day', 'week', 'month')
+
+
+def get_period_start(day, group_by):
+    """
+    Returns the first day of a period containing the day, weeks start on Monday
+    """
+    if group_by == 'week':
+        return day - timedelta(days=day.weekday())
+    if group_by == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def get_periods(start_date, end_date, group_by):
+    """
+    Returns an ordered dict of period start -> number of nights of the [start_date, end_date) range within the period
+    """
+    periods = OrderedDict()
+    day = start_date
+    while day < end_date:
+        period = get_period_start(day, group_by)
+        periods[period] = periods.get(period, 0) + 1
+        day += timedelta(days=1)
+    return periods
+
+
+def get_stats(start_date, end_date, group_by='day', by_category=False):
+    """
+    Returns occupied room nights, revenue and room nights available in the hotel for every period of the [start_date, end_date) range,
+    optionally for every room category, read from the daily rollup. Periods without any booking are included with zeros.
+    Available room nights are counted with the current number of rooms.
+    """
+    room_counts = dict(Room.objects.values_list('category').annotate(rooms=Count('id')).order_by())
+    if not by_category:
+        room_counts = {None: sum(room_counts.values())}
+
+    periods = get_periods(start_date, end_date, group_by)
+    rows = OrderedDict()
+    for period, nights in periods.items():
+        for category_id in sorted(room_counts, key=lambda category_id: category_id or 0):
+            rows[(period, category_id)] = {
+                'occupied': 0,
+                'revenue': Decimal('0.00'),
+                'available': room_counts[category_id] * nights,
+            }
+
+    daily_stats = DailyStat.objects.filter(day__gte=start_date, day__lt=end_date)
+    for day, category_id, occupied_rooms, revenue in daily_stats.values_list('day', 'category', 'occupied_rooms', 'revenue'):
+        key = (get_period_start(day, group_by), category_id if by_category else None)
+        if key not in rows:
+            # a category without rooms left
+            rows[key] = {'occupied': 0, 'revenue': Decimal('0.00'), 'available': 0}
+        rows[key]['occupied'] += occupied_rooms
+        rows[key]['revenue'] += revenue
+
+    return [dict(row, period=period, category=category_id) for (period, category_id), row in sorted(rows.items(), key=lambda item: (item[0][0], item[0][1] or 0))]
@@ -1,7 +1,42 @@
-from django.test import TestCase
-from reservations.models import Room, RoomCategory, Booking, RoomBooking
+from django.test import Client, TestCase, SimpleTestCase, TransactionTestCase
+from django.http import QueryDict
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, IntegrityError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_http_date
+from reservations.models import Room, RoomCategory, Booking, RoomBooking, RoomNight, DailyStat
 from reservations.serializers import BookingSerializer
+from reservations.bulk import BookingImport, describe_integrity_error
+from reservations.availability import RoomIntervalIndex, cheapest_combinations, invalidate_room_index
+from reservations.pricing import get_category_prices, QuoteEngine, quote_stay
+from reservations.filters import BookingFilter
+from reservations.pagination import KeysetPagination, BookingPagination
+from reservations.metrics import request_metrics
+from reservations.asgi import ASGIApplication
+from reservations.database import WriteQueue, WriteQueueFull, DEFAULT_PRAGMAS, lock_for_writing
+from reservations.parsing import BookingRequest, parse_date, parse_room_ids
+from hotel_app.wsgi import application as wsgi_application
 from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from urllib.parse import urlencode
+import asyncio
+import base64
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
 # Create your tests here.
 
@@ -38,10 +73,10 @@ class RoomTestCase(TestCase):
         rooms.append(Room.objects.get(pk=2))
         test_date = datetime.today().date() + timedelta(days=10)
         
-        book1 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=1)),name="x",surname="x",room_ids=rooms[0].id,number_of_people=2,cost=500)
-        book2 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=1)),name="x",surname="x",room_ids=rooms[1].id,number_of_people=2,cost=500)
-        RoomBooking.objects.create(room=rooms[0], booking=book1)
-        RoomBooking.objects.create(room=rooms[1], booking=book2)
+        book1 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=1)),name="x",surname="x",number_of_people=2,cost=500)
+        book2 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=1)),name="x",surname="x",number_of_people=2,cost=500)
+        book1.create_room_bookings([rooms[0]])
+        book2.create_room_bookings([rooms[1]])
 
         # check availability for a new booking
         self.assertEqual(rooms[0].is_available(test_date, test_date + timedelta(days=1)), False)
@@ -53,6 +88,23 @@ class RoomTestCase(TestCase):
         self.assertEqual(rooms[0].is_available(test_date, test_date + timedelta(days=1), book1.id), True)
         self.assertEqual(rooms[0].is_available(test_date, test_date + timedelta(days=1), book2.id), False)
 
+    def test_conflicting_room_ids(self):
+        """Test finding conflicting rooms with a single query"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        rooms = list(Room.objects.all())
+
+        book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=3)),name="x",surname="x",number_of_people=2,cost=500)
+        book.create_room_bookings([rooms[0]])
+
+        with self.assertNumQueries(1):
+            conflicts = Room.get_conflicting_room_ids(rooms, test_date + timedelta(days=2), test_date + timedelta(days=5))
+        self.assertEqual(conflicts, {rooms[0].id})
+        # end date is exclusive
+        self.assertEqual(Room.get_conflicting_room_ids(rooms, test_date + timedelta(days=3), test_date + timedelta(days=5)), set())
+        self.assertEqual(Room.get_conflicting_room_ids(rooms, test_date, test_date + timedelta(days=1), book.id), set())
+        with self.assertNumQueries(0):
+            self.assertEqual(Room.get_conflicting_room_ids([], test_date, test_date + timedelta(days=1)), set())
+
 
     def test_negative_capacity(self):
         """Check that creation of a room with negative capacity fails"""
@@ -60,6 +112,205 @@ class RoomTestCase(TestCase):
         self.assertRaises(Exception, Room.objects.create(number=3,category=cat_A,capacity=-1))
 
 
+class RoomAvailabilityTestCase(TestCase):
+    def setUp(self):
+        invalidate_room_index()
+        cat_A = RoomCategory.objects.create(id="A",price=400,name="A")
+        cat_B = RoomCategory.objects.create(id="B",price=100,name="B")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+        room_2 = Room.objects.create(number=23,category=cat_B,capacity=2)
+        room_3 = Room.objects.create(number=34,category=cat_B,capacity=2)
+
+    def test_interval_index(self):
+        """Test looking up conflicts in the room interval index"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        index = RoomIntervalIndex([
+            (1, test_date, test_date + timedelta(days=10)),
+            (1, test_date + timedelta(days=2), test_date + timedelta(days=3)),
+            (1, test_date + timedelta(days=20), test_date + timedelta(days=25)),
+        ])
+
+        self.assertEqual(index.is_available(1, test_date - timedelta(days=5), test_date), True)
+        self.assertEqual(index.is_available(1, test_date + timedelta(days=5), test_date + timedelta(days=6)), False)
+        self.assertEqual(index.is_available(1, test_date + timedelta(days=10), test_date + timedelta(days=20)), True)
+        self.assertEqual(index.is_available(1, test_date + timedelta(days=15), test_date + timedelta(days=21)), False)
+        self.assertEqual(index.is_available(2, test_date, test_date + timedelta(days=30)), True)
+
+    def test_cheapest_combinations(self):
+        """Test finding the cheapest sets of rooms for a group"""
+        rooms = list(Room.objects.all())
+
+        combinations = cheapest_combinations(rooms, 4, 2)
+        self.assertEqual(combinations[0]["room_numbers"], [23,34])
+        self.assertEqual(combinations[0]["cost"], 400)
+        self.assertEqual(combinations[1]["room_numbers"], [12])
+        self.assertEqual(cheapest_combinations(rooms, 10, 1), [])
+
+    def test_available_endpoint(self):
+        """Test searching for free rooms through the API"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        room = Room.objects.get(number=23)
+        book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=2)),name="x",surname="x",number_of_people=2,cost=200)
+        RoomBooking.objects.create(room=room, booking=book)
+
+        params = {"start_date": str(test_date + timedelta(days=1)), "end_date": str(test_date + timedelta(days=3)), "number_of_people": 4}
+        response = self.client.get("/api/room/available/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([room["number"] for room in response.data["rooms"]], [12,34])
+        self.assertEqual(response.data["combinations"][0]["room_numbers"], [12])
+
+        params["category"] = "B"
+        response = self.client.get("/api/room/available/", params)
+        self.assertEqual([room["number"] for room in response.data["rooms"]], [34])
+        self.assertEqual(response.data["combinations"], [])
+
+        params["start_date"] = str(test_date + timedelta(days=2))
+        response = self.client.get("/api/room/available/", params)
+        self.assertEqual([room["number"] for room in response.data["rooms"]], [23,34])
+
+        response = self.client.get("/api/room/available/", {"start_date": "x", "end_date": str(test_date)})
+        self.assertEqual(response.status_code, 400)
+        for extra in [{"combinations": 0}, {"combinations": -1}, {"combinations": 1000}, {"number_of_people": 0}]:
+            self.assertEqual(self.client.get("/api/room/available/", dict(params, **extra)).status_code, 400)
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        cat_A = RoomCategory.objects.create(id="A",price=400,name="A")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+
+    # the browsable API links static files, which are not collected for tests
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_cached_responses(self):
+        """Test serving room lists from the cache until a room is written"""
+        response = self.client.get("/api/room/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/room/")
+        self.assertEqual(json.loads(response.content.decode())["count"], 1)
+        self.assertEqual(response["ETag"], etag)
+        self.assertNotEqual(self.client.get("/api/room/", {"page": 1})["ETag"], etag)
+
+        response = self.client.post("/api/room/", {"number": 23, "category": "A", "capacity": 2})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get("/api/room/")
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["count"], 2)
+
+        self.client.delete("/api/room/{}/".format(response.data["results"][1]["id"]))
+        self.assertEqual(json.loads(self.client.get("/api/room/").content.decode())["count"], 1)
+
+        # pages of the browsable API hold the CSRF token of their client and are rendered for every request
+        response = self.client.get("/api/room/", HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertIn("csrftoken", response.cookies)
+        response = Client().get("/api/room/", HTTP_ACCEPT="text/html")
+        self.assertIn("csrftoken", response.cookies)
+
+    def test_conditional_requests(self):
+        """Test answering conditional requests with 304 Not Modified"""
+        response = self.client.get("/api/room/category/A/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/room/category/A/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        last_modified = response["Last-Modified"]
+        self.assertEqual(self.client.get("/api/room/category/A/", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        response = self.client.put("/api/room/category/A/", json.dumps({"id": "A", "price": 500, "name": "A"}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/room/category/A/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["price"], "500.00")
+        # a write within the same second still moves Last-Modified on
+        self.assertEqual(self.client.get("/api/room/category/A/", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+        self.assertGreater(parse_http_date(response["Last-Modified"]), parse_http_date(last_modified))
+        self.assertEqual(self.client.get("/api/room/category/B/").status_code, 404)
+
+
+class QuoteTestCase(TestCase):
+    def setUp(self):
+        invalidate_room_index()
+        cat_A = RoomCategory.objects.create(id="A",price="99.99",name="A")
+        cat_B = RoomCategory.objects.create(id="B",price=100,name="B")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+        room_2 = Room.objects.create(number=23,category=cat_B,capacity=2)
+        room_3 = Room.objects.create(number=34,category=cat_B,capacity=2)
+
+    def test_quote_engine(self):
+        """Test pricing stays with per-night rates"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        rooms = list(Room.objects.order_by('id'))
+        engine = QuoteEngine.for_stays([(rooms[:1], test_date, test_date + timedelta(days=2)), (rooms, test_date + timedelta(days=1), test_date + timedelta(days=5))])
+        self.assertEqual(engine.quote(rooms, test_date, test_date + timedelta(days=2)), Decimal("599.98"))
+        self.assertEqual(engine.matrix(rooms[:2], test_date + timedelta(days=3), test_date + timedelta(days=5)), [[Decimal("99.99")] * 2, [Decimal("100")] * 2])
+        self.assertRaises(ValueError, engine.quote, rooms, test_date, test_date + timedelta(days=6))
+
+        # stays far apart are priced in separate periods, nights between them are not priced
+        far_date = datetime(9999, 1, 1).date()
+        engine = QuoteEngine.for_stays([(rooms, test_date, test_date + timedelta(days=1)), (rooms, far_date, far_date + timedelta(days=2))])
+        self.assertEqual([(start_date, end_date) for start_date, end_date, rates, prefix_sums in engine.periods], [(test_date, test_date + timedelta(days=1)), (far_date, far_date + timedelta(days=2))])
+        self.assertEqual(engine.quote(rooms[:1], far_date, far_date + timedelta(days=2)), Decimal("199.98"))
+        self.assertRaises(ValueError, engine.quote, rooms, test_date, test_date + timedelta(days=2))
+
+        # nights can have their own rates
+        weekend_rates = lambda category_ids, start_date, end_date: {
+            category_id: [Decimal(150 if (start_date + timedelta(days=day)).weekday() >= 5 else 100) for day in range((end_date - start_date).days)]
+            for category_id in category_ids
+        }
+        with patch("reservations.pricing.get_night_rates", weekend_rates):
+            self.assertEqual(quote_stay(rooms[1:], test_date, test_date + timedelta(days=7)), 2 * (5 * 100 + 2 * 150))
+
+    def test_booking_cost(self):
+        """Test storing booking costs and room night rates without truncating prices"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        request_data = {"start_date": str(test_date), "end_date": str(test_date + timedelta(days=2)), "name": "x", "surname": "x", "number_of_people": 2, "room_ids": "1"}
+        response = self.client.post("/api/booking/", request_data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["cost"], Decimal("199.98"))
+        self.assertEqual(json.loads(response.content.decode())["cost"], 199.98)
+        booking = Booking.objects.get(pk=response.data["id"])
+        self.assertEqual(booking.cost, Decimal("199.98"))
+        self.assertEqual(sum(RoomNight.objects.filter(booking=booking).values_list("rate", flat=True)), booking.cost)
+
+    def test_quote_endpoint(self):
+        """Test quoting many stays in one call"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=2)),name="x",surname="x",number_of_people=2,cost=200)
+        book.create_room_bookings([Room.objects.get(pk=2)])
+        invalidate_room_index()
+
+        request_data = {
+            "stays": [{"start_date": str(test_date), "end_date": str(test_date + timedelta(days=1)), "room_ids": "1"}],
+            "date_ranges": [
+                {"start_date": str(test_date), "end_date": str(test_date + timedelta(days=2))},
+                {"start_date": str(test_date + timedelta(days=2)), "end_date": str(test_date + timedelta(days=5))},
+            ],
+            "room_sets": ["1,2", [2, 3]],
+        }
+        with self.assertNumQueries(2):
+            response = self.client.post("/api/quote/", request_data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        quotes = response.data["quotes"]
+        self.assertEqual([quote["cost"] for quote in quotes], [Decimal("99.99"), Decimal("399.98"), 400, Decimal("599.97"), 600])
+        self.assertEqual([quote["available"] for quote in quotes], [True, False, False, True, True])
+        self.assertEqual(quotes[4]["nights"], 3)
+
+        request_data = {"stays": [{"start_date": str(test_date), "end_date": str(test_date), "room_ids": "1"}]}
+        response = self.client.post("/api/quote/", request_data, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, "Incorrect stay 1: incorrect date range")
+        request_data = {"stays": [{"start_date": str(test_date), "end_date": str(test_date + timedelta(days=1)), "room_ids": "1,7"}]}
+        self.assertEqual(self.client.post("/api/quote/", request_data, content_type="application/json").data, "Rooms do not exist: 7")
+        request_data = {"stays": [{"start_date": str(test_date), "end_date": str(test_date + timedelta(days=settings.MAX_STAY_NIGHTS + 1)), "room_ids": "1"}]}
+        self.assertEqual(self.client.post("/api/quote/", request_data, content_type="application/json").data, "Incorrect stay 1: Stays are limited to {} nights".format(settings.MAX_STAY_NIGHTS))
+        self.assertEqual(self.client.post("/api/quote/", {}, content_type="application/json").status_code, 400)
+
+
 class RoomCategoryTestCase(TestCase):
 
     def test_creation(self):
@@ -67,6 +318,24 @@ class RoomCategoryTestCase(TestCase):
         self.assertEqual(RoomCategory.objects.create(id="A",price=100,name="Test2").id, "A")
         self.assertRaises(Exception, RoomCategory.objects.create(id="B",price=-100,name="Test2"))
 
+    def test_price_cache(self):
+        """Test that category prices are cached and refreshed when a category is written"""
+        cat_A = RoomCategory.objects.create(id="A",price=100,name="A")
+        room = Room.objects.create(number=12,category=cat_A,capacity=5)
+        self.assertEqual(room.get_cost(), 100)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Room.calculate_cost([room, room], 3), 600)
+
+        cat_A.price = 150
+        cat_A.save()
+        self.assertEqual(room.get_cost(), 150)
+
+        # categories created after the table was loaded are picked up
+        cat_B = RoomCategory(id="B",price=50,name="B")
+        RoomCategory.objects.bulk_create([cat_B])
+        self.assertEqual(Room.objects.create(number=23,category=cat_B,capacity=2).get_cost(), 50)
+
 
 class BookingTestCase(TestCase):
     def setUp(self):
@@ -96,9 +365,9 @@ class BookingTestCase(TestCase):
         rooms_1 = [Room.objects.get(pk=room_id) for room_id in room_ids_1.split(',')]
         rooms_2 = [Room.objects.get(pk=room_id) for room_id in room_ids_2.split(',')]
 
-        book1 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=10)),name="x",surname="x",room_ids=room_ids_1,number_of_people=2,cost=500)
+        book1 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=10)),name="x",surname="x",number_of_people=2,cost=500)
         test_date += timedelta(days=10)
-        book2 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=10)),name="x",surname="x",room_ids=room_ids_2,number_of_people=2,cost=500)
+        book2 = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=10)),name="x",surname="x",number_of_people=2,cost=500)
 
         book1.create_room_bookings(rooms_1)
         book1_roombookings = RoomBooking.objects.filter(booking=book1)
@@ -113,12 +382,277 @@ class BookingTestCase(TestCase):
         room_ids = "1,2"
         rooms = [Room.objects.get(pk=room_id) for room_id in room_ids.split(',')]
 
-        book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=10)),name="x",surname="x",room_ids=room_ids,number_of_people=2,cost=500)
+        book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=10)),name="x",surname="x",number_of_people=2,cost=500)
         book.create_room_bookings(rooms)
 
         self.assertEqual(book.get_room_numbers(), [12,23])
         self.assertEqual(book.get_duration(), 10)
 
+    def test_room_nights(self):
+        """Test maintaining, counting and rebuilding room nights"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        rooms = list(Room.objects.all())
+
+        book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=3)),name="x",surname="x",number_of_people=2,cost=500)
+        book.create_room_bookings(rooms)
+        self.assertEqual(RoomNight.objects.filter(booking=book).count(), 6)
+        self.assertEqual(RoomNight.get_occupancy(test_date + timedelta(days=2), test_date + timedelta(days=5)), {test_date + timedelta(days=2): 2})
+
+        call_command("rebuild_room_nights", verify=True, stdout=StringIO())
+        RoomNight.objects.filter(night=test_date).delete()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_room_nights", verify=True, stdout=StringIO(), stderr=StringIO())
+        call_command("rebuild_room_nights", stdout=StringIO())
+        self.assertEqual(RoomNight.objects.filter(booking=book).count(), 6)
+
+        book.delete()
+        self.assertEqual(RoomNight.objects.count(), 0)
+
+    def test_room_filters(self):
+        """Test filtering the booking list by rooms with a single query"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        rooms = list(Room.objects.all())
+        for i, booking_rooms in enumerate([rooms[:1], rooms[1:], rooms]):
+            book = Booking.objects.create(start_date=test_date + timedelta(days=i),end_date=(test_date + timedelta(days=i + 1)),name="x",surname=str(i),number_of_people=2,cost=500)
+            book.create_room_bookings(booking_rooms)
+
+        get_surnames = lambda params: sorted(booking["surname"] for booking in self.client.get("/api/booking/", params).data["results"])
+        with self.assertNumQueries(3):
+            self.assertEqual(get_surnames({"room_number": "12"}), ["0", "2"])
+        self.assertEqual(get_surnames({"room_number": "12,23"}), ["0", "1", "2"])
+        self.assertEqual(get_surnames({"room_number": ["12", "23"]}), ["0", "1", "2"])
+        self.assertEqual(get_surnames({"room_category": "B"}), ["1", "2"])
+        self.assertEqual(get_surnames({"room_number": "12", "room_category": "B"}), ["2"])
+        self.assertEqual(get_surnames({"room_number": "99"}), [])
+        self.assertEqual(get_surnames({"room_number": "x"}), [])
+
+    def test_date_filters(self):
+        """Test filtering the booking list by date ranges"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        for i, (start, end) in enumerate([(0, 2), (2, 5), (4, 6), (8, 9)]):
+            Booking.objects.create(start_date=test_date + timedelta(days=start),end_date=(test_date + timedelta(days=end)),name="x",surname=str(i),number_of_people=2,cost=500)
+
+        get_surnames = lambda params: sorted(booking["surname"] for booking in self.client.get("/api/booking/", params).data["results"])
+        day = lambda days: str(test_date + timedelta(days=days))
+        self.assertEqual(get_surnames({"start_date_after": day(2), "start_date_before": day(4)}), ["1", "2"])
+        self.assertEqual(get_surnames({"end_date_after": day(5)}), ["1", "2", "3"])
+        self.assertEqual(get_surnames({"end_date_before": day(2)}), ["0"])
+        self.assertEqual(get_surnames({"overlaps_from": day(1), "overlaps_to": day(3)}), ["0", "1"])
+        self.assertEqual(get_surnames({"overlaps_from": day(5)}), ["2", "3"])
+        self.assertEqual(get_surnames({"in_house": day(2)}), ["1"])
+        self.assertEqual(get_surnames({"in_house": day(4), "surname": "2"}), ["2"])
+        self.assertEqual(self.client.get("/api/booking/", {"in_house": "x"}).status_code, 400)
+
+    @patch.object(BookingPagination, "page_size", 2)
+    def test_cursor_pagination(self):
+        """Test paging through bookings with cursors"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        for i, start in enumerate([3, 1, 1, 1, 2]):
+            Booking.objects.create(start_date=test_date + timedelta(days=start),end_date=(test_date + timedelta(days=start + 1)),name="x",surname=str(i),number_of_people=2,cost=500)
+
+        surnames = []
+        response = self.client.get("/api/booking/", {"pagination": "cursor", "name": "x"})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            surnames += [booking["surname"] for booking in response.data["results"]]
+            if response.data["next"] is None:
+                break
+            self.assertIn("name=x", response.data["next"])
+            # no counting query on cursor pages
+            with self.assertNumQueries(2):
+                response = self.client.get(response.data["next"])
+        self.assertEqual(surnames, ["1", "2", "3", "4", "0"])
+
+        self.assertEqual(self.client.get("/api/booking/", {"cursor": "x"}).status_code, 404)
+        # cursors holding values the ordering fields can't take are rejected instead of failing in the query
+        for url, position in [("/api/room/", ["abc"]), ("/api/room/", [None]), ("/api/booking/", ["2030-02-30", 1]), ("/api/booking/", [str(test_date), [1]])]:
+            cursor = base64.b64encode(json.dumps(position).encode()).decode()
+            self.assertEqual(self.client.get(url, {"cursor": cursor}).status_code, 404)
+        self.assertEqual(self.client.get("/api/room/", {"pagination": "cursor"}).data["results"][0]["number"], 12)
+        self.assertEqual(self.client.get("/api/room/").data["count"], 2)
+
+    def test_booking_api_creation(self):
+        """Test creating bookings through the API with a fixed number of queries"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        request_data = {
+            "start_date": str(test_date),
+            "end_date": str(test_date + timedelta(days=2)),
+            "name": "Test",
+            "surname": "Testing",
+            "number_of_people": 2,
+            "room_ids": "1"
+        }
+        get_category_prices()
+
+        with CaptureQueriesContext(connection) as single_room_queries:
+            response = self.client.post("/api/booking/", request_data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["cost"], 800)
+
+        request_data["start_date"] = str(test_date + timedelta(days=2))
+        request_data["end_date"] = str(test_date + timedelta(days=4))
+        request_data["room_ids"] = "1,2"
+        with CaptureQueriesContext(connection) as two_rooms_queries:
+            response = self.client.post("/api/booking/", request_data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["cost"], 1000)
+        self.assertEqual(len(two_rooms_queries), len(single_room_queries))
+
+        # unknown rooms are reported instead of failing with a server error
+        request_data["room_ids"] = "1,7,9"
+        response = self.client.post("/api/booking/", request_data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, "Rooms do not exist: 7, 9")
+
+        request_data["room_ids"] = "1,1"
+        self.assertEqual(self.client.post("/api/booking/", request_data).data, "Duplicate room IDs: 1,1")
+        request_data["room_ids"] = "1,x"
+        self.assertEqual(self.client.post("/api/booking/", request_data).data, "Incorrect room IDs: 1,x")
+        del request_data["room_ids"]
+        self.assertEqual(self.client.post("/api/booking/", request_data).data, "Room IDs are missing")
+        response = self.client.post("/api/booking/", json.dumps([request_data]), content_type="application/json")
+        self.assertEqual((response.status_code, response.data), (400, "Incorrect request body: expected an object"))
+        response = self.client.post("/api/booking/", json.dumps(dict(request_data, room_ids=True)), content_type="application/json")
+        self.assertEqual((response.status_code, response.data), (400, "Incorrect room IDs: True"))
+
+        # stays longer than MAX_STAY_NIGHTS are rejected before any room night is written
+        request_data.update(room_ids="1", start_date=str(test_date + timedelta(days=10)), end_date=str(test_date + timedelta(days=settings.MAX_STAY_NIGHTS + 11)))
+        response = self.client.post("/api/booking/", request_data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, "Stays are limited to {} nights".format(settings.MAX_STAY_NIGHTS))
+
+    def test_booking_api_amendment(self):
+        """Test that amending a booking touches only changed rows with a fixed number of queries"""
+        category = RoomCategory.objects.get(id="B")
+        Room.objects.bulk_create([Room(number=100 + i, category=category, capacity=1) for i in range(6)])
+        extra_room_ids = list(Room.objects.filter(number__gte=100).order_by("number").values_list("id", flat=True))
+        test_date = datetime.today().date() + timedelta(days=10)
+        request_data = {"start_date": str(test_date), "end_date": str(test_date + timedelta(days=2)), "name": "Test", "surname": "Testing", "number_of_people": 2, "room_ids": "1"}
+        booking_id = self.client.post("/api/booking/", request_data).data["id"]
+        url = "/api/booking/{}/".format(booking_id)
+        night_ids = set(RoomNight.objects.filter(booking=booking_id).values_list("id", flat=True))
+
+        # only the guest changed, rooms and nights are left alone
+        request_data["name"] = "Renamed"
+        with CaptureQueriesContext(connection) as rename_queries:
+            response = self.client.put(url, json.dumps(request_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["name"], "Renamed")
+        self.assertEqual(response.data["cost"], 800)
+        self.assertFalse(any("reservations_roomnight" in query["sql"] for query in rename_queries.captured_queries))
+
+        # a room added and a night added, kept nights stay
+        request_data["room_ids"] = "1,2"
+        request_data["end_date"] = str(test_date + timedelta(days=3))
+        with CaptureQueriesContext(connection) as one_room_queries:
+            response = self.client.put(url, json.dumps(request_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["room_ids"], "1,2")
+        self.assertEqual(response.data["cost"], 1500)
+        self.assertTrue(night_ids < set(RoomNight.objects.filter(booking=booking_id).values_list("id", flat=True)))
+        self.assertEqual(RoomNight.objects.filter(booking=booking_id).count(), 6)
+
+        # more rooms changed at once take the same number of queries
+        request_data["room_ids"] = ",".join(str(room_id) for room_id in [2] + extra_room_ids)
+        request_data["start_date"] = str(test_date + timedelta(days=1))
+        with CaptureQueriesContext(connection) as many_rooms_queries:
+            response = self.client.put(url, json.dumps(request_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["cost"], 1400)
+        self.assertEqual(response.data["room_numbers"], [23] + list(range(100, 106)))
+        self.assertEqual(len(many_rooms_queries), len(one_room_queries))
+        self.assertLess(len(rename_queries), len(one_room_queries))
+        self.assertEqual(self.client.get(url).data["room_ids"], request_data["room_ids"])
+        call_command("rebuild_room_nights", verify=True, stdout=StringIO())
+        call_command("rebuild_daily_stats", verify=True, stdout=StringIO())
+
+        # a stay which has started already can still be amended if it keeps its rooms and dates
+        Booking.objects.filter(pk=booking_id).update(start_date=datetime.today().date() - timedelta(days=1))
+        request_data["start_date"] = str(datetime.today().date() - timedelta(days=1))
+        request_data["surname"] = "Amended"
+        self.assertEqual(self.client.put(url, json.dumps(request_data), content_type="application/json").status_code, 200)
+        request_data["number_of_people"] = 20
+        self.assertEqual(self.client.put(url, json.dumps(request_data), content_type="application/json").data, "Rooms have insufficient capacity")
+
+    def test_booking_api_concurrent_amendment(self):
+        """Test that an amendment is worked out against the booking as it is once the write lock is held"""
+        Room.objects.create(number=34, category=RoomCategory.objects.get(id="B"), capacity=4)
+        test_date = datetime.today().date() + timedelta(days=10)
+        request_data = {"start_date": str(test_date), "end_date": str(test_date + timedelta(days=2)), "name": "Test", "surname": "Testing", "number_of_people": 2, "room_ids": "1"}
+        booking_id = self.client.post("/api/booking/", request_data).data["id"]
+
+        def move_first(model):
+            # another request moves the booking to room 2 while this one waits for the write lock
+            if not RoomBooking.objects.filter(booking=booking_id, room=2).exists():
+                Booking.objects.get(pk=booking_id).update_room_bookings([Room.objects.get(pk=2)])
+            lock_for_writing(model)
+
+        request_data["room_ids"] = "1,3"
+        with patch("reservations.database.lock_for_writing", side_effect=move_first):
+            response = self.client.put("/api/booking/{}/".format(booking_id), json.dumps(request_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["room_ids"], "1,3")
+        self.assertEqual(list(RoomBooking.objects.filter(booking=booking_id).order_by("room").values_list("room", flat=True)), [1, 3])
+        call_command("rebuild_room_nights", verify=True, stdout=StringIO())
+        call_command("rebuild_daily_stats", verify=True, stdout=StringIO())
+
+        self.assertEqual(self.client.put("/api/booking/{}/".format(booking_id + 1), json.dumps(request_data), content_type="application/json").data, "Booking does not exist")
+
+    def test_group_booking(self):
+        """Test booking more rooms than fitted into the former room_ids column, which are listed from room bookings"""
+        category = RoomCategory.objects.get(id="B")
+        Room.objects.bulk_create([Room(number=100 + i, category=category, capacity=1) for i in range(60)])
+        room_ids = list(Room.objects.filter(number__gte=100).order_by("number").values_list("id", flat=True))
+        test_date = datetime.today().date() + timedelta(days=10)
+        request_data = {"start_date": str(test_date), "end_date": str(test_date + timedelta(days=2)), "name": "Group", "surname": "Testing", "number_of_people": 60, "room_ids": room_ids}
+        response = self.client.post("/api/booking/", json.dumps(request_data), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["room_ids"], ",".join(str(room_id) for room_id in room_ids))
+        self.assertEqual(response.data["cost"], 12000)
+        self.assertEqual(RoomNight.objects.filter(booking=response.data["id"]).count(), 120)
+
+        booking = Booking.objects.get(pk=response.data["id"])
+        self.assertEqual(booking.get_room_ids(), room_ids)
+        listed = self.client.get("/api/booking/").data["results"][0]
+        self.assertEqual(listed["room_ids"], response.data["room_ids"])
+        self.assertEqual(listed["room_numbers"], list(range(100, 160)))
+
+
+class BookingRequestTestCase(SimpleTestCase):
+    def test_parse(self):
+        """Test parsing a booking payload into typed values once"""
+        test_date = datetime.today().date() + timedelta(days=3)
+        booking_request = BookingRequest.parse(QueryDict(urlencode({
+            "start_date": str(test_date), "end_date": str(test_date + timedelta(days=2)), "name": "Test", "number_of_people": "3", "room_ids": "1; 2 ,3"
+        })))
+        self.assertEqual((booking_request.start_date, booking_request.end_date), (test_date, test_date + timedelta(days=2)))
+        self.assertEqual(booking_request.room_ids, (1, 2, 3))
+        self.assertEqual(booking_request.number_of_people, 3)
+        self.assertEqual(booking_request.get_duration(), 2)
+        self.assertEqual(booking_request.get_serializer_data(100), {"start_date": test_date, "end_date": test_date + timedelta(days=2), "name": "Test", "number_of_people": 3, "cost": 100})
+        with self.assertRaises(AttributeError):
+            booking_request.start_date = test_date
+        with self.assertRaises(AttributeError):
+            booking_request.extra = 1
+
+        self.assertEqual(parse_room_ids([4, "5"]), [4, 5])
+        self.assertEqual(parse_room_ids(6), [6])
+        self.assertEqual(parse_date("2024-02-29"), datetime(2024, 2, 29).date())
+        for value in ["2023-02-29", "2023-2-1", "01-02-2023", "2023-01-01x", None]:
+            self.assertRaises(ValueError, parse_date, value)
+        payload = {"start_date": "2030-01-01", "end_date": "2030-01-02", "number_of_people": 1, "room_ids": "1"}
+        for field, value in [("start_date", None), ("end_date", "tomorrow"), ("end_date", "9999-01-01"), ("number_of_people", "two"), ("room_ids", "")]:
+            self.assertRaises(ValueError, BookingRequest.parse, dict(payload, **{field: value}))
+
+    def test_parse_rejects_other_types(self):
+        """Test that booleans, fractional numbers and payloads other than objects are not coerced into valid values"""
+        payload = {"start_date": "2030-01-01", "end_date": "2030-01-02", "number_of_people": 1, "room_ids": [1]}
+        for field, value in [("number_of_people", 2.9), ("number_of_people", True), ("room_ids", True), ("room_ids", [1.9]), ("room_ids", [False]), ("room_ids", {"1": 1})]:
+            self.assertRaises(ValueError, BookingRequest.parse, dict(payload, **{field: value}))
+        self.assertRaises(ValueError, BookingRequest.parse, [payload])
+        self.assertRaises(ValueError, BookingRequest.parse, "payload")
+        self.assertEqual(BookingRequest.parse(dict(payload, number_of_people=2.0, room_ids=[3.0])).room_ids, (3,))
+
 
 class BookingSerializerTestCase(TestCase):
     def setUp(self):
@@ -147,4 +681,660 @@ class BookingSerializerTestCase(TestCase):
         self.assertEqual(serializer.is_valid(), True)
         booking = serializer.save(rooms=rooms)
 
-        self.assertEqual(len(RoomBooking.objects.filter(booking=booking)),2)
\ No newline at end of file
+        self.assertEqual(len(RoomBooking.objects.filter(booking=booking)),2)
+    def test_list_query_count(self):
+        """Tests that listing bookings runs a fixed number of queries regardless of the page size"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        rooms = list(Room.objects.all())
+
+        for number_of_bookings in [1, 20]:
+            for i in range(number_of_bookings):
+                book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=1)),name="x",surname="x",number_of_people=2,cost=500)
+                book.create_room_bookings(rooms)
+                test_date += timedelta(days=1)
+
+            # count, bookings and room bookings with rooms
+            with self.assertNumQueries(3):
+                response = self.client.get("/api/booking/")
+            self.assertEqual(response.data["results"][0]["room_numbers"], [12,23])
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/booking/" + str(book.id) + "/")
+        self.assertEqual(response.data["room_numbers"], [12,23])
+
+
+
+class BookingCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        cat_A = RoomCategory.objects.create(id="A",price=400,name="A")
+        cat_B = RoomCategory.objects.create(id="B",price=100,name="B")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+        room_2 = Room.objects.create(number=23,category=cat_B,capacity=4)
+
+    def test_cached_booking(self):
+        """Test serving booking details, costs and durations from a single cached entry"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        request_data = {"start_date": str(test_date), "end_date": str(test_date + timedelta(days=2)), "name": "x", "surname": "x", "number_of_people": 2, "room_ids": "1"}
+        booking_id = self.client.post("/api/booking/", request_data).data["id"]
+        stats = self.client.get("/api/booking/cache/").data
+
+        self.assertEqual(self.client.get("/api/booking/{}/".format(booking_id)).data["room_numbers"], [12])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/booking/{}/".format(booking_id)).data["cost"], 800)
+            self.assertEqual(self.client.get("/api/booking/{}/cost/".format(booking_id)).data, {"cost": 800})
+            self.assertEqual(self.client.get("/api/booking/{}/duration/".format(booking_id)).data, {"duration": 2})
+        response = self.client.get("/api/booking/cache/")
+        self.assertEqual(response.data["hits"] - stats["hits"], 3)
+        self.assertEqual(response.data["misses"] - stats["misses"], 1)
+
+        request_data["room_ids"] = "2"
+        request_data["end_date"] = str(test_date + timedelta(days=3))
+        response = self.client.put("/api/booking/{}/".format(booking_id), json.dumps(request_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/api/booking/{}/".format(booking_id)).data["room_numbers"], [23])
+        self.assertEqual(self.client.get("/api/booking/{}/duration/".format(booking_id)).data, {"duration": 3})
+
+        room = Room.objects.get(pk=2)
+        room.number = 24
+        room.save()
+        self.assertEqual(self.client.get("/api/booking/{}/".format(booking_id)).data["room_numbers"], [24])
+
+        # writes outside of the API, e.g. through the admin, drop the cached booking too
+        booking = Booking.objects.get(pk=booking_id)
+        booking.name = "y"
+        booking.save()
+        self.assertEqual(self.client.get("/api/booking/{}/".format(booking_id)).data["name"], "y")
+        RoomBooking.objects.create(room=Room.objects.get(pk=1), booking=booking)
+        self.assertEqual(self.client.get("/api/booking/{}/".format(booking_id)).data["room_numbers"], [24, 12])
+
+        self.assertEqual(self.client.delete("/api/booking/{}/".format(booking_id)).status_code, 204)
+        self.assertEqual(self.client.get("/api/booking/{}/".format(booking_id)).status_code, 404)
+        self.assertEqual(self.client.get("/api/booking/{}/cost/".format(booking_id)).status_code, 400)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        request_metrics.reset()
+        cat_A = RoomCategory.objects.create(id="A",price=400,name="A")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+
+    def test_server_timing(self):
+        """Test reporting times of a request in the Server-Timing header"""
+        response = self.client.get("/api/booking/", {"name": "x"})
+        self.assertRegex(response["Server-Timing"], r'^total;dur=[0-9.]+, db;dur=[0-9.]+;desc="1 queries", serialization;dur=[0-9.]+, render;dur=[0-9.]+$')
+
+        # serialization covers building the data of bookings, method fields included
+        test_date = datetime.today().date() + timedelta(days=10)
+        Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=1)),name="x",surname="x",number_of_people=2,cost=400)
+        slow_duration = lambda serializer, booking: time.sleep(0.02) or 1
+        with patch.object(BookingSerializer, "get_duration", slow_duration):
+            response = self.client.get("/api/booking/", {"name": "x"})
+        self.assertGreaterEqual(float(re.search(r'serialization;dur=([0-9.]+)', response["Server-Timing"]).group(1)), 20)
+
+    def test_metrics_endpoint(self):
+        """Test serving request metrics of views in the Prometheus format"""
+        for i in range(3):
+            self.client.get("/api/booking/")
+        self.client.get("/api/nothing/")
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        metrics = response.content.decode()
+        self.assertIn('hotel_request_duration_seconds_count{view="BookingList.get"} 3\n', metrics)
+        self.assertIn('hotel_db_queries{view="BookingList.get",quantile="0.99"} 1\n', metrics)
+        self.assertIn('hotel_db_queries_count{view="unresolved"} 1\n', metrics)
+        self.assertIn("# TYPE hotel_booking_cache_hits_total counter\n", metrics)
+
+    def test_slow_queries(self):
+        """Test logging queries slower than a threshold"""
+        with self.settings(METRICS_SLOW_QUERY_MS=0, METRICS_SLOW_QUERY_LIMIT=1):
+            with self.assertLogs("reservations.metrics", "WARNING") as logs:
+                self.client.get("/api/room/category/")
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Slow query of RoomCategoryList.get", logs.output[0])
+
+
+class BookingImportTestCase(TestCase):
+    def setUp(self):
+        cat_A = RoomCategory.objects.create(id="A",price=400,name="A")
+        cat_B = RoomCategory.objects.create(id="B",price=100,name="B")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+        room_2 = Room.objects.create(number=23,category=cat_B,capacity=4)
+
+    def test_import_api(self):
+        """Test importing a batch of bookings as JSON Lines"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        book = Booking.objects.create(start_date=test_date,end_date=(test_date + timedelta(days=2)),name="x",surname="x",number_of_people=2,cost=200)
+        book.create_room_bookings([Room.objects.get(pk=2)])
+
+        rows = [
+            {"start_date": str(test_date), "end_date": str(test_date + timedelta(days=2)), "name": "A", "surname": "A", "number_of_people": 2, "room_ids": "1"},
+            {"start_date": str(test_date + timedelta(days=1)), "end_date": str(test_date + timedelta(days=3)), "name": "B", "surname": "B", "number_of_people": 2, "room_ids": "1"},
+            {"start_date": str(test_date + timedelta(days=1)), "end_date": str(test_date + timedelta(days=2)), "name": "C", "surname": "C", "number_of_people": 2, "room_ids": [2]},
+            {"start_date": str(test_date + timedelta(days=2)), "end_date": str(test_date + timedelta(days=4)), "name": "D", "surname": "D", "number_of_people": 9, "room_ids": "1;2"},
+            {"start_date": str(test_date + timedelta(days=4)), "end_date": str(test_date + timedelta(days=5)), "name": "E", "surname": "E", "number_of_people": 2, "room_ids": "3"},
+            {"start_date": str(test_date), "name": "F"},
+            {"start_date": str(test_date + timedelta(days=5)), "end_date": "9999-01-01", "name": "G", "surname": "G", "number_of_people": 2, "room_ids": "1"},
+            {"start_date": str(test_date + timedelta(days=20)), "end_date": str(test_date + timedelta(days=21)), "name": "H", "surname": "H", "number_of_people": 0, "room_ids": "1"},
+            {"start_date": str(test_date + timedelta(days=20)), "end_date": str(test_date + timedelta(days=21)), "name": "I", "surname": "I", "number_of_people": -1, "room_ids": "1"},
+            {"start_date": str(test_date + timedelta(days=20)), "end_date": str(test_date + timedelta(days=21)), "name": "", "number_of_people": 1, "room_ids": "1"},
+            {"start_date": str(test_date + timedelta(days=20)), "end_date": str(test_date + timedelta(days=21)), "name": "J", "surname": "J", "number_of_people": 1, "room_ids": "1,1"},
+        ]
+        body = "\n".join(json.dumps(row) for row in rows)
+        response = self.client.post("/api/booking/bulk/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([row["status"] for row in response.data["rows"]], ["created", "error", "error", "created", "error", "error", "error", "error", "error", "error", "error"])
+        self.assertEqual(response.data["rows"][1]["error"], "Rooms booked already for given date range: 1")
+        self.assertEqual(response.data["rows"][4]["error"], "Rooms do not exist: 3")
+        self.assertEqual(response.data["rows"][6]["error"], "Stays are limited to {} nights".format(settings.MAX_STAY_NIGHTS))
+        # rows are checked like bookings made through the API
+        self.assertEqual(response.data["rows"][7]["error"], "Incorrect row: number_of_people: Ensure this value is greater than or equal to 1.")
+        self.assertEqual(response.data["rows"][8]["error"], response.data["rows"][7]["error"])
+        self.assertEqual(response.data["rows"][9]["error"], "Incorrect row: name: This field may not be blank.; surname: This field is required.")
+        self.assertEqual(response.data["rows"][10]["error"], "Incorrect row: Duplicate room IDs: 1,1")
+        self.assertEqual(describe_integrity_error(IntegrityError("UNIQUE constraint failed: reservations_roomnight.room_id, reservations_roomnight.night")), "Rooms booked already for given date range")
+        self.assertEqual(describe_integrity_error(IntegrityError("CHECK constraint failed: reservations_booking")), "Incorrect row: CHECK constraint failed: reservations_booking")
+
+        booking = Booking.objects.get(pk=response.data["rows"][3]["id"])
+        self.assertEqual(booking.cost, 1000)
+        self.assertEqual(booking.get_room_numbers(), [12,23])
+        self.assertEqual(RoomNight.objects.filter(booking=booking).count(), 4)
+
+        response = self.client.post("/api/booking/bulk/", "{", content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_command(self):
+        """Test importing bookings from a CSV file"""
+        test_date = datetime.today().date() + timedelta(days=10)
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write("start_date,end_date,name,surname,number_of_people,room_ids\n")
+            for day in range(50):
+                csv_file.write("{},{},x,x,2,\"1,2\"\n".format(test_date + timedelta(days=day), test_date + timedelta(days=day + 1)))
+        output = StringIO()
+        try:
+            call_command("import_bookings", csv_file.name, chunk_size=20, stdout=output, stderr=StringIO())
+        finally:
+            os.remove(csv_file.name)
+
+        report = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(report), 50)
+        self.assertEqual(set(row["status"] for row in report), {"created"})
+        self.assertEqual(Booking.objects.count(), 50)
+        self.assertEqual(RoomNight.objects.count(), 100)
+
+
+class BookingExportTestCase(TestCase):
+    def setUp(self):
+        cat_A = RoomCategory.objects.create(id="A",price=400,name="A")
+        cat_B = RoomCategory.objects.create(id="B",price=100,name="B")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+        room_2 = Room.objects.create(number=23,category=cat_B,capacity=4)
+        test_date = datetime.today().date() + timedelta(days=10)
+        for day in range(12):
+            book = Booking.objects.create(start_date=test_date + timedelta(days=day),end_date=(test_date + timedelta(days=day + 1)),name="x",surname=str(day),number_of_people=2,cost=500)
+            book.create_room_bookings([room_1, room_2])
+
+    def test_export_api(self):
+        """Test streaming bookings as CSV and JSON Lines"""
+        response = self.client.get("/api/booking/export/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,start_date,end_date,name,surname,number_of_people,cost,room_ids,room_numbers")
+        self.assertEqual(len(lines), 13)
+        self.assertTrue(lines[1].endswith(',500.00,"1,2","12,23"'))
+
+        response = self.client.get("/api/booking/export/", {"file_format": "jsonl", "surname": "3"})
+        bookings = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(bookings), 1)
+        self.assertEqual(bookings[0]["room_numbers"], [12,23])
+
+        self.assertEqual(self.client.get("/api/booking/export/", {"file_format": "xml"}).status_code, 400)
+
+    def test_export_command(self):
+        """Test exporting bookings in chunks with a fixed number of queries per chunk"""
+        output = StringIO()
+        # two queries for each of three chunks and one finding no more bookings
+        with self.assertNumQueries(7):
+            call_command("export_bookings", format="jsonl", chunk_size=5, stdout=output)
+        bookings = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([booking["surname"] for booking in bookings], [str(day) for day in range(12)])
+        self.assertEqual(bookings[-1]["room_numbers"], [12,23])
+
+
+class DailyStatTestCase(TestCase):
+    def setUp(self):
+        cat_A = RoomCategory.objects.create(id="A",price=400,name="A")
+        cat_B = RoomCategory.objects.create(id="B",price=100,name="B")
+        room_1 = Room.objects.create(number=12,category=cat_A,capacity=5)
+        room_2 = Room.objects.create(number=23,category=cat_B,capacity=4)
+        # a Monday at least ten days ahead
+        self.test_date = datetime.today().date() + timedelta(days=10)
+        self.test_date += timedelta(days=(7 - self.test_date.weekday()) % 7)
+
+    def get_daily_stats(self):
+        return {(stat.day, stat.category_id): (stat.occupied_rooms, stat.revenue) for stat in DailyStat.objects.all() if stat.occupied_rooms}
+
+    def test_incremental_updates(self):
+        """Test updating daily stats on booking creation, update and deletion"""
+        request_data = {
+            "start_date": str(self.test_date),
+            "end_date": str(self.test_date + timedelta(days=2)),
+            "name": "Test",
+            "surname": "Testing",
+            "number_of_people": 2,
+            "room_ids": "1,2"
+        }
+        response = self.client.post("/api/booking/", request_data)
+        self.assertEqual(response.status_code, 201)
+        booking_id = response.data["id"]
+        self.assertEqual(self.get_daily_stats(), {
+            (self.test_date, "A"): (1, 400), (self.test_date, "B"): (1, 100),
+            (self.test_date + timedelta(days=1), "A"): (1, 400), (self.test_date + timedelta(days=1), "B"): (1, 100),
+        })
+
+        request_data["end_date"] = str(self.test_date + timedelta(days=3))
+        request_data["room_ids"] = "2"
+        response = self.client.put("/api/booking/{}/".format(booking_id), json.dumps(request_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_daily_stats(), {(self.test_date + timedelta(days=day), "B"): (1, 100) for day in range(3)})
+        call_command("rebuild_daily_stats", verify=True, stdout=StringIO())
+
+        self.assertEqual(self.client.delete("/api/booking/{}/".format(booking_id)).status_code, 204)
+        self.assertEqual(self.get_daily_stats(), {})
+
+        # nights of a room follow it to a new category and leave with it when it's deleted
+        request_data["room_ids"] = "1,2"
+        self.assertEqual(self.client.post("/api/booking/", request_data).status_code, 201)
+        response = self.client.put("/api/room/2/", json.dumps({"number": 23, "category": "A", "capacity": 4}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_daily_stats(), {(self.test_date + timedelta(days=day), "A"): (2, 500) for day in range(3)})
+        call_command("rebuild_daily_stats", verify=True, stdout=StringIO())
+        self.assertEqual(self.client.delete("/api/room/1/").status_code, 204)
+        self.assertEqual(self.get_daily_stats(), {(self.test_date + timedelta(days=day), "A"): (1, 100) for day in range(3)})
+        call_command("rebuild_daily_stats", verify=True, stdout=StringIO())
+
+    def test_stats_api(self):
+        """Test occupancy and revenue reports grouped by week and category"""
+        book = Booking.objects.create(start_date=self.test_date + timedelta(days=5),end_date=(self.test_date + timedelta(days=8)),name="x",surname="x",number_of_people=2,cost=1200)
+        book.create_room_bookings([Room.objects.get(pk=1)])
+        params = {"start_date": str(self.test_date), "end_date": str(self.test_date + timedelta(days=21)), "group_by": "week"}
+
+        response = self.client.get("/api/stats/occupancy/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["occupied_rooms"] for row in response.data], [2, 1, 0])
+        self.assertEqual(response.data[0]["available_rooms"], 14)
+        self.assertEqual(response.data[0]["occupancy"], round(2 / 14, 4))
+
+        response = self.client.get("/api/stats/revenue/", dict(params, by_category="true"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row["category"], row["room_nights"], row["revenue"]) for row in response.data[:4]], [("A", 2, 800), ("B", 0, 0), ("A", 1, 400), ("B", 0, 0)])
+        self.assertEqual(len(response.data), 6)
+
+        response = self.client.get("/api/stats/revenue/", dict(params, group_by="month", start_date=str(self.test_date.replace(day=1))))
+        self.assertEqual(sum(row["revenue"] for row in response.data), 1200)
+
+        self.assertEqual(self.client.get("/api/stats/revenue/", dict(params, group_by="year")).status_code, 400)
+        self.assertEqual(self.client.get("/api/stats/occupancy/", {"start_date": str(self.test_date)}).status_code, 400)
+        response = self.client.get("/api/stats/occupancy/", {"start_date": "1900-01-01", "end_date": "2100-01-01", "by_category": "true"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, "Reports are limited to {} days".format(settings.MAX_STATS_DAYS))
+
+    def test_rebuild_command(self):
+        """Test verifying and rebuilding daily stats from room nights"""
+        book = Booking.objects.create(start_date=self.test_date,end_date=(self.test_date + timedelta(days=2)),name="x",surname="x",number_of_people=2,cost=1000)
+        book.create_room_bookings(list(Room.objects.all()))
+        expected = self.get_daily_stats()
+        DailyStat.objects.filter(category="A").delete()
+        DailyStat.objects.filter(category="B").update(revenue=0)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_daily_stats", verify=True, stdout=StringIO(), stderr=StringIO())
+        call_command("rebuild_daily_stats", stdout=StringIO())
+        self.assertEqual(self.get_daily_stats(), expected)
+        call_command("rebuild_daily_stats", verify=True, stdout=StringIO())
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_seed_hotel(self):
+        """Test generating a hotel with non-overlapping single and multi-room bookings"""
+        output = StringIO()
+        call_command("seed_hotel", rooms=30, bookings=120, categories=3, multi_room_ratio=0.5, seed=1, stdout=output)
+        self.assertIn("Created 120 bookings", output.getvalue())
+        self.assertEqual(Room.objects.count(), 30)
+        self.assertEqual(RoomCategory.objects.count(), 3)
+        self.assertEqual(Booking.objects.count(), 120)
+        self.assertTrue(Booking.objects.annotate(rooms=Count("roombooking")).filter(rooms__gt=1).exists())
+        call_command("rebuild_room_nights", verify=True, stdout=StringIO())
+        call_command("rebuild_daily_stats", verify=True, stdout=StringIO())
+
+        # bookings added to existing rooms start after the existing ones
+        call_command("seed_hotel", rooms=0, bookings=10, seed=2, stdout=StringIO())
+        self.assertEqual(Booking.objects.count(), 130)
+        call_command("rebuild_room_nights", verify=True, stdout=StringIO())
+        call_command("seed_hotel", rooms=0, bookings=0, stdout=StringIO())
+        self.assertEqual(Booking.objects.count(), 130)
+
+        # the API accepts a booking next to generated ones
+        booking = Booking.objects.order_by("-end_date").first()
+        request_data = {"start_date": str(booking.end_date), "end_date": str(booking.end_date + timedelta(days=1)), "name": "x", "surname": "x", "number_of_people": 1, "room_ids": booking.get_room_ids()}
+        self.assertEqual(self.client.post("/api/booking/", request_data).status_code, 201)
+
+    def test_benchmark(self):
+        """Test running the benchmark and writing results as JSON without changing data"""
+        call_command("seed_hotel", rooms=10, bookings=50, seed=1, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            call_command("benchmark", iterations=3, warmup=1, seed=1, output=path, stderr=StringIO())
+            call_command("benchmark", iterations=3, warmup=1, cases="booking_list", output=path + ".2", compare=path, stderr=StringIO())
+            with open(path) as results_file:
+                results = json.load(results_file)
+            with open(path + ".2") as results_file:
+                compared = json.load(results_file)
+
+        self.assertEqual(set(results["results"]), {"booking_create", "booking_update", "booking_list", "availability", "serialization", "parsing"})
+        self.assertEqual(sum(result["errors"] for result in results["results"].values()), 0)
+        self.assertEqual(results["meta"]["bookings"], 50)
+        self.assertEqual(set(compared["changes"]), {"booking_list"})
+        self.assertEqual(Booking.objects.count(), 50)
+        with self.assertRaises(CommandError):
+            call_command("benchmark", cases="nothing", stderr=StringIO())
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked on SQLite")
+class QueryPlanTestCase(TestCase):
+    """
+    Checks that query shapes used by the API are served by indexes instead of full table scans
+    """
+    def get_query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndexes(self, queryset):
+        plan = self.get_query_plan(queryset)
+        table_scans = [step for step in plan if re.match(r"SCAN (TABLE )?reservations_\w+( AS \w+)?$", step)]
+        self.assertEqual(table_scans, [], "\n".join(plan))
+
+    def test_booking_list_filters(self):
+        """Test plans of booking list filters"""
+        test_date = str(datetime.today().date())
+        for params in [
+            {"start_date": test_date},
+            {"end_date": test_date},
+            {"start_date": test_date, "end_date": test_date},
+            {"name": "x"},
+            {"surname": "x"},
+            {"name": "x", "surname": "x"},
+            {"number_of_people": "2"},
+            {"cost": "500"},
+            {"start_date_after": test_date, "start_date_before": test_date},
+            {"end_date_after": test_date, "end_date_before": test_date},
+            {"overlaps_from": test_date, "overlaps_to": test_date},
+            {"overlaps_from": test_date},
+            {"overlaps_to": test_date},
+            {"in_house": test_date},
+        ]:
+            with self.subTest(params=params):
+                self.assertUsesIndexes(BookingFilter(QueryDict(urlencode(params)), queryset=Booking.objects.all()).qs)
+
+    def test_room_filters(self):
+        """Test plans of filtering bookings by rooms"""
+        for params in [
+            {"room_number": "12"},
+            {"room_number": "12,23"},
+            {"room_category": "A"},
+            {"room_number": "12", "room_category": "A", "name": "x"},
+        ]:
+            with self.subTest(params=params):
+                self.assertUsesIndexes(BookingFilter(QueryDict(urlencode(params)), queryset=Booking.objects.all()).qs)
+
+    def test_availability_queries(self):
+        """Test plans of conflict checks and occupancy counts"""
+        test_date = datetime.today().date()
+        self.assertUsesIndexes(RoomNight.objects.filter(room__in=[1, 2], night__gte=test_date, night__lt=test_date + timedelta(days=3)).exclude(booking=1).values_list('room_id', flat=True).distinct())
+        self.assertUsesIndexes(RoomNight.objects.filter(night__gte=test_date, night__lt=test_date + timedelta(days=3)).values_list('night').annotate(rooms=Count('id')).order_by('night'))
+        self.assertUsesIndexes(Booking.objects.filter(end_date__gt=test_date, start_date__lt=test_date + timedelta(days=3)))
+
+    def test_keyset_pagination_queries(self):
+        """Test plans of cursor pages, which should read the index in order instead of sorting"""
+        paginator = KeysetPagination(("start_date", "id"))
+        queryset = Booking.objects.order_by("start_date", "id").filter(paginator.get_position_filter([str(datetime.today().date()), "100"]))[:201]
+        self.assertUsesIndexes(queryset)
+        self.assertFalse([step for step in self.get_query_plan(queryset) if "TEMP B-TREE" in step])
+
+    def test_export_queries(self):
+        """Test plans of reading bookings in chunks"""
+        self.assertUsesIndexes(Booking.objects.order_by('id').filter(id__gt=100)[:500])
+        self.assertUsesIndexes(RoomBooking.objects.filter(booking_id__in=list(range(100, 600, 7))).order_by('id').values_list('booking_id', 'room__number'))
+
+
+class ASGITestCase(TransactionTestCase):
+    """
+    Calls the ASGI application directly, its database work runs in threads, so data has to be committed
+    """
+    def setUp(self):
+        category = RoomCategory.objects.create(id='A', price=100, name='A')
+        Room.objects.create(number=1, category=category, capacity=2)
+        Room.objects.create(number=2, category=category, capacity=4)
+        self.start_date = datetime.today().date() + timedelta(days=5)
+        invalidate_room_index()
+
+    def call(self, application, method, path, query_string=b'', body=b'', content_type=b'application/json'):
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string, 'headers': [(b'content-type', content_type)]}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(application(scope, receive, send))
+        return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+    def test_handlers(self):
+        """Test that async handlers answer like the views"""
+        application = ASGIApplication(wsgi_application, threads=2)
+        booking_data = {"start_date": str(self.start_date), "end_date": str(self.start_date + timedelta(days=2)), "name": "Test", "surname": "Guest", "number_of_people": 2, "room_ids": "1"}
+        status, content = self.call(application, 'POST', '/api/booking/', body=json.dumps(booking_data).encode())
+        self.assertEqual(status, 201, content)
+        self.assertEqual(json.loads(content.decode())["cost"], 200)
+        status, content = self.call(application, 'POST', '/api/booking/', body=urlencode(booking_data).encode(), content_type=b'application/x-www-form-urlencoded')
+        self.assertEqual(status, 400)
+        status, content = self.call(application, 'POST', '/api/booking/', body=b'{"name": "Test"}')
+        self.assertEqual(status, 400)
+
+        query = urlencode({"start_date": self.start_date, "end_date": self.start_date + timedelta(days=1), "number_of_people": 1}).encode()
+        status, content = self.call(application, 'GET', '/api/room/available/', query)
+        self.assertEqual(status, 200)
+        self.assertEqual([room["number"] for room in json.loads(content.decode())["rooms"]], [2])
+        status, content = self.call(application, 'GET', '/api/room/available/', b'start_date=2020-01-01')
+        self.assertEqual(status, 400)
+
+        status, content = self.call(application, 'GET', '/api/booking/', urlencode({"overlaps_from": self.start_date}).encode())
+        self.assertEqual(status, 200)
+        self.assertEqual([booking["name"] for booking in json.loads(content.decode())["results"]], ["Test"])
+        self.assertEqual(self.call(application, 'GET', '/api/booking/', b'overlaps_from=abc')[0], 400)
+
+        # other requests are served by the WSGI application
+        status, content = self.call(application, 'GET', '/api/room/')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(content.decode())["count"], 2)
+
+    def test_server_busy(self):
+        """Test that requests beyond the capacity of the database pool are refused"""
+        application = ASGIApplication(wsgi_application, threads=1, max_pending=0)
+        application.pool.jobs = 1
+        status, content = self.call(application, 'GET', '/api/room/')
+        self.assertEqual(status, 503)
+
+
+class DatabaseTestCase(TestCase):
+    def test_pragmas(self):
+        """Test that pragmas are set on new SQLite connections"""
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], DEFAULT_PRAGMAS["cache_size"])
+
+        # the setting changes single pragmas, others keep their defaults
+        new_connection = connections["default"].__class__(connections["default"].settings_dict)
+        try:
+            with override_settings(SQLITE_PRAGMAS={"cache_size": -1000}), new_connection.cursor() as cursor:
+                cursor.execute("PRAGMA cache_size")
+                self.assertEqual(cursor.fetchone()[0], -1000)
+                cursor.execute("PRAGMA synchronous")
+                self.assertEqual(cursor.fetchone()[0], 1)
+        finally:
+            new_connection.close()
+
+    def test_write_queue(self):
+        """Test that the write queue lets writers go in order and refuses them when full or after a timeout"""
+        queue = WriteQueue()
+        order = []
+        queue.acquire(max_waiting=2, timeout=1)
+
+        def write(number):
+            queue.acquire(max_waiting=2, timeout=5)
+            order.append(number)
+            queue.release()
+
+        threads = [threading.Thread(target=write, args=(number,)) for number in range(2)]
+        for number, thread in enumerate(threads):
+            thread.start()
+            # waits until the writer is queued, so that writers queue in order
+            while len(queue.waiters) <= number:
+                time.sleep(0.01)
+        self.assertRaises(WriteQueueFull, queue.acquire, 2, 1)
+        queue.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [0, 1])
+        self.assertFalse(queue.busy)
+
+        queue.acquire(max_waiting=2, timeout=1)
+        self.assertRaises(WriteQueueFull, queue.acquire, 2, 0.05)
+        self.assertEqual(len(queue.waiters), 0)
+        queue.release()
+        self.assertFalse(queue.busy)
+
+    def test_busy_response(self):
+        """Test that bookings are refused with 503 responses when the write queue is full"""
+        category = RoomCategory.objects.create(id="A", price=100, name="A")
+        Room.objects.create(number=1, category=category, capacity=2)
+        start_date = datetime.today().date() + timedelta(days=5)
+        request_data = {"start_date": str(start_date), "end_date": str(start_date + timedelta(days=1)), "name": "Test", "surname": "Guest", "number_of_people": 1, "room_ids": "1"}
+        with self.settings(SQLITE_WRITE_QUEUE=True), patch("reservations.database.write_queue.acquire", side_effect=WriteQueueFull):
+            response = self.client.post("/api/booking/", request_data)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(Booking.objects.count(), 0)
+        with self.settings(SQLITE_WRITE_QUEUE=True):
+            booking_id = self.client.post("/api/booking/", request_data).data["id"]
+
+        # deletes wait in the same queue
+        url = "/api/booking/{}/".format(booking_id)
+        with self.settings(SQLITE_WRITE_QUEUE=True), patch("reservations.database.write_queue.acquire", side_effect=WriteQueueFull):
+            self.assertEqual(self.client.delete(url).status_code, 503)
+        with self.settings(SQLITE_WRITE_QUEUE=True):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+            self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(DailyStat.objects.filter(occupied_rooms__gt=0).count(), 0)
+
+        # and so do imports, rows left are reported as busy
+        body = json.dumps(request_data)
+        with self.settings(SQLITE_WRITE_QUEUE=True), patch("reservations.database.write_queue.acquire", side_effect=WriteQueueFull):
+            self.assertEqual(self.client.post("/api/booking/bulk/", body, content_type="application/x-ndjson").status_code, 503)
+            report = BookingImport([request_data, dict(request_data, start_date=request_data["end_date"], end_date=str(start_date + timedelta(days=2)))], chunk_size=1).run()
+        self.assertEqual([row["error"] for row in report], ["Database is busy, please try again"] * 2)
+        self.assertEqual(Booking.objects.count(), 0)
+        with self.settings(SQLITE_WRITE_QUEUE=True):
+            self.assertEqual(self.client.post("/api/booking/bulk/", body, content_type="application/x-ndjson").data["created"], 1)
+
+
+BOOK_ROOM_SCRIPT = """
+import time
+from django.test import Client
+time.sleep(max(0, %(start_at)f - time.time()))
+response = Client().post("/api/booking/", %(request_data)r)
+print(response.status_code)
+"""
+
+class BookingConcurrencyTestCase(SimpleTestCase):
+    """
+    Books the same room from several processes at once against a temporary database file
+    """
+    processes = 8
+
+    def manage(self, env, *args):
+        return subprocess.Popen([sys.executable, os.path.join(settings.BASE_DIR, "manage.py")] + list(args), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    def test_double_booking(self):
+        """Test that concurrent requests can't book the same room twice"""
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "db.sqlite3")
+            env = dict(os.environ, SQLITE_PATH=database)
+            for args in [("migrate", "-v", "0"), ("shell", "-c", "from reservations.models import RoomCategory, Room; Room.objects.create(number=12,category=RoomCategory.objects.create(id='A',price=400,name='A'),capacity=5)")]:
+                output, errors = self.manage(env, *args).communicate()
+                self.assertEqual(errors, "")
+
+            # every requested range contains the same night, so at most one of them can succeed
+            test_date = datetime.today().date() + timedelta(days=10)
+            start_at = time.time() + 3
+            processes = []
+            for i in range(self.processes):
+                request_data = {
+                    "start_date": str(test_date + timedelta(days=i % 2)),
+                    "end_date": str(test_date + timedelta(days=2 + i % 2)),
+                    "name": "Test",
+                    "surname": str(i),
+                    "number_of_people": 2,
+                    "room_ids": "1"
+                }
+                processes.append(self.manage(env, "shell", "-c", BOOK_ROOM_SCRIPT % {"start_at": start_at, "request_data": request_data}))
+            statuses = [int(process.communicate()[0].split()[-1]) for process in processes]
+
+            self.assertEqual(statuses.count(201), 1)
+            self.assertEqual([status for status in statuses if status not in (201, 400, 503)], [])
+            with sqlite3.connect(database) as db:
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM reservations_booking").fetchone()[0], 1)
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM reservations_roomnight").fetchone()[0], 2)
+
+
+class LoadTestTestCase(SimpleTestCase):
+    """
+    Runs the load test against the app served in-process on a temporary database file
+    """
+    def manage(self, env, *args):
+        return subprocess.run([sys.executable, os.path.join(settings.BASE_DIR, "manage.py")] + list(args), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    def test_loadtest(self):
+        """Test replaying a request mix with conflicting bookings and cleaning up afterwards"""
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "db.sqlite3")
+            output = os.path.join(directory, "results.json")
+            env = dict(os.environ, SQLITE_PATH=database)
+            self.assertEqual(self.manage(env, "migrate", "-v", "0").returncode, 0)
+            self.assertEqual(self.manage(env, "seed_hotel", "--rooms", "20", "--bookings", "100", "--seed", "1").returncode, 0)
+
+            mix = "list_bookings=2,list_rooms=1,create_booking=2,update_booking=1,conflicting_booking=2"
+            result = self.manage(env, "loadtest", "--requests", "40", "--concurrency", "4", "--mix", mix, "--seed", "1", "--output", output, "--cleanup")
+            self.assertEqual(result.returncode, 0, result.stderr)
+            with open(output) as results_file:
+                results = json.load(results_file)["results"]
+
+            self.assertEqual(results["total"]["operations"], 40)
+            self.assertEqual(set(results["total"]["statuses"]) - {"200", "201", "400", "503"}, set())
+            conflicting = results["conflicting_booking"]
+            self.assertLessEqual(conflicting["statuses"].get("201", 0), 1)
+            self.assertEqual(conflicting["rejected"] + conflicting["statuses"].get("201", 0) + conflicting["lock_contention"], conflicting["operations"])
+            with sqlite3.connect(database) as db:
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM reservations_booking WHERE name = 'Loadtest'").fetchone()[0], 0)
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM reservations_booking").fetchone()[0], 100)
+            self.assertEqual(self.manage(env, "rebuild_room_nights", "--verify").returncode, 0)
+            self.assertEqual(self.manage(env, "rebuild_daily_stats", "--verify").returncode, 0)
@@ -3,11 +3,19 @@ from . import views
 
 urlpatterns = [
     url(r'^room/(?P<pk>[0-9]+)/$', views.RoomDetail.as_view()),
+    url(r'^room/available/$', views.RoomAvailability.as_view()),
     url(r'^room/$', views.RoomList.as_view()),
-    url(r'^room/category/(?P<pk>[0-9]+)/$', views.RoomCategoryDetail.as_view()),
+    url(r'^room/category/(?P<pk>[^/]+)/$', views.RoomCategoryDetail.as_view()),
     url(r'^room/category/$', views.RoomCategoryList.as_view()),
     url(r'^booking/(?P<pk>[0-9]+)/duration/$', views.BookingDuration.as_view()),
     url(r'^booking/(?P<pk>[0-9]+)/cost/$', views.BookingCost.as_view()),
     url(r'^booking/(?P<pk>[0-9]+)/$', views.BookingDetail.as_view()),
-    url(r'^booking/$', views.BookingList.as_view())
+    url(r'^booking/bulk/$', views.BookingBulkImport.as_view()),
+    url(r'^booking/cache/$', views.BookingCacheStats.as_view()),
+    url(r'^booking/export/$', views.BookingExport.as_view()),
+    url(r'^booking/$', views.BookingList.as_view()),
+    url(r'^stats/occupancy/$', views.OccupancyStats.as_view()),
+    url(r'^stats/revenue/$', views.RevenueStats.as_view()),
+    url(r'^quote/$', views.Quote.as_view()),
+    url(r'^metrics/$', views.Metrics.as_view())
 ]
\ No newline at end of file
@@ -1,170 +1,442 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
 from reservations.serializers import RoomSerializer, RoomCategorySerializer, BookingSerializer, RoomBookingSerializer
-from reservations.models import Room, RoomCategory, Booking, RoomBooking
+from reservations.models import Room, RoomCategory, Booking, RoomBooking, DailyStat
+from reservations.availability import get_room_index, cheapest_combinations
+from reservations.bulk import read_booking_rows, BookingImport
+from reservations.export import iterate_bookings, EXPORT_FORMATS
+from reservations.filters import BookingFilter
+from reservations.pagination import OptionalKeysetPagination, BookingPagination
+from reservations.stats import get_stats, GROUPINGS
+from reservations.pricing import QuoteEngine, quote_stay
+from reservations.caching import CachedResponseMixin, get_cached_booking, get_booking_cache_stats
+from reservations.metrics import request_metrics
+from reservations.database import locked_write, DatabaseBusy
+from reservations.parsing import BookingRequest, parse_date, parse_room_ids, check_stay_length
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView, ListAPIView, GenericAPIView, RetrieveDestroyAPIView
-from django.db import transaction
-from datetime import datetime
+from rest_framework.views import APIView
+from django.db import IntegrityError
 
 
 ### Rooms API ###
 
-class RoomList(ListCreateAPIView):
+class RoomList(CachedResponseMixin, ListCreateAPIView):
     """
     List all rooms, or create a new room.
+    Pass pagination=cursor to page through rooms ordered by ID with cursors instead of page numbers.
     """
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    cache_scope = 'rooms'
+    pagination_class = OptionalKeysetPagination
 
-class RoomDetail(RetrieveUpdateDestroyAPIView):
+class RoomDetail(CachedResponseMixin, RetrieveUpdateDestroyAPIView):
     """
     Get, update or delete a selected room.
     """
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    cache_scope = 'rooms'
 
-class RoomCategoryList(ListCreateAPIView):
+class RoomAvailability(GenericAPIView):
+    """
+    Lists rooms free for a given date range along with the cheapest sets of free rooms able to host a given number of people.
+    Please provide start_date and end_date, and optionally number_of_people (1 by default), category and combinations (3 by default, at most 10).
+    """
+    queryset = Room.objects.all()
+    serializer_class = RoomSerializer
+
+    def get(self, request, format=None):
+        try:
+            params = parse_availability_params(request.query_params)
+        except ValueError as err:
+            return Response(str(err), status=status.HTTP_400_BAD_REQUEST)
+        return Response(find_available_rooms(*params), status=status.HTTP_200_OK)
+
+# The search for the cheapest sets of rooms grows with the number of combinations asked for
+MAX_COMBINATIONS = 10
+
+# Returns start date, end date, number of people, category and number of combinations of a free room search,
+# raises ValueError with a message for the client when they are incorrect
+def parse_availability_params(params):
+    try:
+        start_date = parse_date(params["start_date"])
+        end_date = parse_date(params["end_date"])
+        number_of_people = int(params.get("number_of_people", 1))
+        limit = int(params.get("combinations", 3))
+    except (KeyError, ValueError) as err:
+        raise ValueError("Incorrect parameters: " + str(err))
+    if not Booking.is_date_range_correct(start_date, end_date):
+        raise ValueError("Incorrect date range")
+    if number_of_people < 1:
+        raise ValueError("Incorrect number of people: {}".format(number_of_people))
+    if not 1 <= limit <= MAX_COMBINATIONS:
+        raise ValueError("Incorrect number of combinations, use 1 to {}".format(MAX_COMBINATIONS))
+    return start_date, end_date, number_of_people, params.get("category"), limit
+
+# Returns rooms free for the date range and the cheapest sets of them able to host the number of people
+def find_available_rooms(start_date, end_date, number_of_people, category, limit):
+    rooms = Room.objects.order_by('number')
+    if category is not None:
+        rooms = rooms.filter(category=category)
+    free_rooms = get_room_index().free_rooms(rooms, start_date, end_date)
+    nights = (end_date - start_date).days
+    return {
+        "rooms": [dict(RoomSerializer(room).data, price=room.get_cost()) for room in free_rooms],
+        "combinations": cheapest_combinations(free_rooms, number_of_people, nights, limit)
+    }
+
+class RoomCategoryList(CachedResponseMixin, ListCreateAPIView):
     """
     List all room categories, or create a new room category.
     """
     queryset = RoomCategory.objects.all()
     serializer_class = RoomCategorySerializer
+    cache_scope = 'room_categories'
 
-class RoomCategoryDetail(RetrieveUpdateDestroyAPIView):
+class RoomCategoryDetail(CachedResponseMixin, RetrieveUpdateDestroyAPIView):
     """
     Get, update or delete a selected room category.
     """
     queryset = RoomCategory.objects.all()
     serializer_class = RoomCategorySerializer
+    cache_scope = 'room_categories'
 
 
 ### Booking API ###
 
-# Format room IDs from a string or list
-def format_room_ids(room_ids):
-    if type(room_ids) is str:
-        room_ids = room_ids.replace(" ","").replace(";",",").split(',')
-    return ",".join(str(room_id) for room_id in room_ids)
+# Returns a list of Room objects for a list of room IDs, using a single query.
+# Optionally locks the rooms until the end of the current transaction.
+def fetch_rooms_by_ids(room_ids, for_update=False):
+    rooms = Room.objects.select_for_update() if for_update else Room.objects.all()
+    rooms = rooms.in_bulk(room_ids)
+    missing_room_ids = [str(room_id) for room_id in room_ids if room_id not in rooms]
+    if missing_room_ids:
+        raise Exception("Rooms do not exist: " + ", ".join(missing_room_ids))
+    return [rooms[room_id] for room_id in room_ids]
+
+def busy_response():
+    return Response("Database is busy, please try again", status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-# Returns a list of Room objects for a list of room IDs.
-fetch_rooms_by_ids = lambda room_ids: [Room.objects.get(pk=room_id) for room_id in room_ids.split(',')]
+# Validates and saves a new or an existing booking within a single transaction.
+# The payload is parsed once into a BookingRequest before any database work, so malformed requests never wait for a lock.
+# Rooms are locked until the transaction ends on databases supporting row locks, and the unique index
+# on room nights rejects a double booking made by a concurrent request that passed validation too.
+# On SQLite the whole database is locked for writing up front, after waiting for a turn in the write queue if it's on.
+# An existing booking is read with its rooms only once the lock is held, so changes are worked out against its current state.
+def save_booking(request_data, booking_id=None):
+    try:
+        booking_request = BookingRequest.parse(request_data)
+    except ValueError as err:
+        return Response(str(err), status=status.HTTP_400_BAD_REQUEST)
+    booking = None
+    try:
+        with locked_write(Booking):
+            if booking_id is not None:
+                booking = Booking.prefetch_room_bookings(Booking.objects.select_for_update().filter(pk=booking_id)).first()
+                if booking is None:
+                    return Response("Booking does not exist", status=status.HTTP_400_BAD_REQUEST)
+            try:
+                rooms = fetch_rooms_by_ids(booking_request.room_ids, for_update=True)
+                if booking is not None and tuple(booking.get_room_ids()) == booking_request.room_ids \
+                        and (booking.start_date, booking.end_date) == (booking_request.start_date, booking_request.end_date):
+                    # the same rooms on the same dates are still available and cost the same
+                    if not Room.check_rooms_capacity(rooms, booking_request.number_of_people):
+                        raise Exception("Rooms have insufficient capacity")
+                    cost = booking.cost
+                    rooms = None
+                else:
+                    Booking.validate_booking_data(booking_request, rooms, booking_id)
+                    cost = quote_stay(rooms, booking_request.start_date, booking_request.end_date)
+            except Exception as err:
+                return Response(str(err), status=status.HTTP_400_BAD_REQUEST)
 
-calculate_duration = lambda booking_data: (datetime.strptime(booking_data["end_date"], "%Y-%m-%d").date() - datetime.strptime(booking_data["start_date"], "%Y-%m-%d").date()).days
+            serializer = BookingSerializer(booking, data=booking_request.get_serializer_data(cost))
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            serializer.save(rooms=rooms)
+    except IntegrityError:
+        return Response("Rooms booked already for given date range", status=status.HTTP_400_BAD_REQUEST)
+    except DatabaseBusy:
+        return busy_response()
+    return Response(serializer.data, status=status.HTTP_201_CREATED if booking is None else status.HTTP_200_OK)
 
 class BookingList(ListAPIView):
     """
     List all bookings or create a new one.
     When creating a new booking, please provide room_ids as a list or a string with ids separated by commas.
-    This API endpoint allows for filtering results using GET request parameters. Use room_number parameter to filter by room number.
+    This API endpoint allows for filtering results using GET request parameters. Use room_number parameter to filter by room number
+    and room_category parameter to filter by room category, both accept multiple values separated by commas.
+    Use start_date_after, start_date_before, end_date_after and end_date_before parameters to filter by date ranges,
+    overlaps_from and overlaps_to to find bookings overlapping a period and in_house to find bookings of guests staying on a given night.
+    Pass pagination=cursor to page through bookings ordered by start date with cursors, which stays fast however deep the page is.
     Please note that the cost of booking is calculated on the server side, so the parameter will be ignored. 
     """
     serializer_class = BookingSerializer
 
-    def get_queryset(self):
-        queryset = Booking.objects.all()
-        params = ['start_date', 'end_date', 'name', 'surname', 'number_of_people', 'cost']
-        options = {}
-        empty_options = []
-
-        for param in params:
-            options[param] = self.request.query_params.get(param)
-        for option in options:
-            if options[option] is None:
-                empty_options.append(option)
-        for option in empty_options:
-            del(options[option])
-        
-        queryset = queryset.filter(**options)
-
-        room_number = self.request.query_params.get('room_number')
-        if room_number is not None:
-            room_id = Room.objects.get(number=room_number).id
-            room_bookings = list(RoomBooking.objects.filter(room=room_id))
-            booking_ids = [x.booking.id for x in room_bookings]
-            queryset = queryset.filter(pk__in=booking_ids)
-
-        return queryset
+    queryset = Booking.prefetch_room_bookings(Booking.objects.all())
+    filterset_class = BookingFilter
+    pagination_class = BookingPagination
 
     def post(self, request, format=None):
+        return save_booking(request.data)
 
-        booking_data = request.data.copy()
-        booking_data["room_ids"] = format_room_ids(booking_data["room_ids"])
-        rooms = fetch_rooms_by_ids(booking_data["room_ids"])
-        try:
-            Booking.validate_booking_data(booking_data, rooms)
-            duration = calculate_duration(booking_data)
-            booking_data["cost"] = Room.calculate_cost(rooms, duration)
-        except Exception as err:
-            return Response(str(err), status=status.HTTP_400_BAD_REQUEST)
-        print(booking_data["room_ids"])
-
-        serializer = BookingSerializer(data=booking_data)
-        if serializer.is_valid():
-            with transaction.atomic():
-                serializer.save(rooms=rooms)
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-                
 class BookingDetail(RetrieveDestroyAPIView):
     """
-    Retrieves, deletes or updates a specific booking.
+    Retrieves, deletes or updates a specific booking. Bookings are retrieved through the booking cache.
     When updating a booking, please provide room_ids as a list or a string with ids separated by commas.
     Please note that the cost of booking is calculated on the server side, so the parameter will be ignored.
     """
-    queryset = Booking.objects.all()
+    queryset = Booking.prefetch_room_bookings(Booking.objects.all())
     serializer_class = BookingSerializer
 
+    def retrieve(self, request, pk, *args, **kwargs):
+        data = get_cached_booking(int(pk))
+        if data is None:
+            raise NotFound()
+        return Response(data, status=status.HTTP_200_OK)
+
     def put(self, request, pk, format=None):
+        return save_booking(request.data, int(pk))
+
+    # Deleting a booking reads its room nights to take them off daily stats before writing,
+    # so like saves it waits for its turn and takes the write lock up front.
+    def destroy(self, request, pk, *args, **kwargs):
         try:
-            booking = Booking.objects.get(pk=pk)
-        except Booking.DoesNotExist:
-            return Response("Booking does not exist", status=status.HTTP_400_BAD_REQUEST)
+            with locked_write(Booking):
+                booking = Booking.objects.select_for_update().filter(pk=pk).first()
+                if booking is None:
+                    raise NotFound()
+                booking.delete()
+        except DatabaseBusy:
+            return busy_response()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class BookingCacheStats(GenericAPIView):
+    """
+    Returns numbers of hits and misses of the booking cache behind booking details, costs and durations, counted by the serving process.
+    """
+    queryset = Booking.objects.all()
+    serializer_class = BookingSerializer
+
+    def get(self, request, format=None):
+        return Response(get_booking_cache_stats(), status=status.HTTP_200_OK)
+
+class BookingBulkImport(GenericAPIView):
+    """
+    Imports a batch of bookings sent as JSON Lines or as CSV with a header row.
+    Rows need start_date, end_date, name, surname, number_of_people and room_ids separated by commas or semicolons.
+    The format is taken from the file_format parameter (jsonl or csv) or from the text/csv content type, JSON Lines being the default.
+    Rows are validated against each other and existing bookings, and a status is returned for each of them.
+    When the database is busy before any row is created the response is 503 Service Unavailable.
+    """
+    queryset = Booking.objects.all()
+    serializer_class = BookingSerializer
 
-        booking_data = request.data.copy()
-        booking_data["room_ids"] = format_room_ids(booking_data["room_ids"])
-        rooms = fetch_rooms_by_ids(booking_data["room_ids"])
+    def post(self, request, format=None):
+        file_format = request.query_params.get("file_format")
+        if file_format is None:
+            file_format = "csv" if request.content_type.startswith("text/csv") else "jsonl"
         try:
-            Booking.validate_booking_data(booking_data, rooms, booking.id)
-            duration = calculate_duration(booking_data)
-            booking_data["cost"] = Room.calculate_cost(rooms, duration)
+            rows = read_booking_rows(request.body.decode("utf-8").splitlines(), file_format)
         except Exception as err:
             return Response(str(err), status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = BookingSerializer(booking, data=booking_data)
-        if serializer.is_valid():
-            serializer.save(rooms=rooms)
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        booking_import = BookingImport(rows)
+        report = booking_import.run()
+        if booking_import.busy and not any(row["status"] == "created" for row in report):
+            return busy_response()
+        response = {
+            "created": sum(1 for row in report if row["status"] == "created"),
+            "failed": sum(1 for row in report if row["status"] == "error"),
+            "rows": report
+        }
+        return Response(response, status=status.HTTP_200_OK)
+
+class BookingExport(GenericAPIView):
+    """
+    Streams all bookings as a CSV (default) or JSON Lines file, selected with the file_format parameter.
+    Accepts the same filtering parameters as the booking list.
+    """
+    queryset = Booking.objects.all()
+    serializer_class = BookingSerializer
+
+    def get(self, request, format=None):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in EXPORT_FORMATS:
+            return Response("Unsupported format: " + file_format, status=status.HTTP_400_BAD_REQUEST)
+        export, content_type = EXPORT_FORMATS[file_format]
+
+        filterset = BookingFilter(request.query_params, queryset=Booking.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        bookings = iterate_bookings(filterset.qs)
+        response = StreamingHttpResponse(export(bookings), content_type=content_type)
+        response["Content-Disposition"] = 'attachment; filename="bookings.' + file_format + '"'
+        return response
 
 class BookingDuration(GenericAPIView):
     """
-    Returns a duration of a specific booking.
+    Returns a duration of a specific booking, read from the booking cache.
     """
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
 
     def get(self, request, pk, format=None):
-        try:
-            booking = Booking.objects.get(pk=pk)
-        except Booking.DoesNotExist:
+        booking = get_cached_booking(int(pk))
+        if booking is None:
             return Response("Booking does not exist", status=status.HTTP_400_BAD_REQUEST)
-        response = {"duration":booking.get_duration()}
+        response = {"duration":booking["duration"]}
         return Response(response, status=status.HTTP_200_OK)
 
 class BookingCost(GenericAPIView):
     """
-    Returns a cost of a specific booking.
+    Returns a cost of a specific booking, read from the booking cache.
     """
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
 
     def get(self, request, pk, format=None):
-        try:
-            booking = Booking.objects.get(pk=pk)
-        except Booking.DoesNotExist:
+        booking = get_cached_booking(int(pk))
+        if booking is None:
             return Response("Booking does not exist", status=status.HTTP_400_BAD_REQUEST)
-        response = {"cost":booking.cost}
-        return Response(response, status=status.HTTP_200_OK)
\ No newline at end of file
+        response = {"cost":booking["cost"]}
+        return Response(response, status=status.HTTP_200_OK)
+
+### Stats API ###
+
+class StatsView(GenericAPIView):
+    """
+    Base view of reports read from daily stats, parses start_date, end_date, group_by and by_category parameters
+    """
+    queryset = DailyStat.objects.all()
+
+    def get(self, request, format=None):
+        params = request.query_params
+        try:
+            start_date = parse_date(params["start_date"])
+            end_date = parse_date(params["end_date"])
+        except (KeyError, ValueError) as err:
+            return Response("Incorrect parameters: " + str(err), status=status.HTTP_400_BAD_REQUEST)
+        if start_date >= end_date:
+            return Response("Incorrect date range", status=status.HTTP_400_BAD_REQUEST)
+        max_days = getattr(settings, 'MAX_STATS_DAYS', 1830)
+        if max_days is not None and (end_date - start_date).days > max_days:
+            return Response("Reports are limited to {} days".format(max_days), status=status.HTTP_400_BAD_REQUEST)
+        group_by = params.get("group_by", "day")
+        if group_by not in GROUPINGS:
+            return Response("Incorrect group_by, use one of: " + ", ".join(GROUPINGS), status=status.HTTP_400_BAD_REQUEST)
+        by_category = params.get("by_category", "").lower() in ("1", "true", "yes")
+
+        rows = get_stats(start_date, end_date, group_by, by_category)
+        return Response([self.format_row(row, by_category) for row in rows], status=status.HTTP_200_OK)
+
+    def format_row(self, row, by_category):
+        raise NotImplementedError
+
+class OccupancyStats(StatsView):
+    """
+    Returns occupied and available room nights and the occupancy rate for every day, week or month of a date range.
+    Please provide start_date and end_date (excluded), and optionally group_by (day, week or month) and by_category=true.
+    """
+    def format_row(self, row, by_category):
+        result = {"period": row["period"]}
+        if by_category:
+            result["category"] = row["category"]
+        result["occupied_rooms"] = row["occupied"]
+        result["available_rooms"] = row["available"]
+        result["occupancy"] = round(row["occupied"] / row["available"], 4) if row["available"] else None
+        return result
+
+class RevenueStats(StatsView):
+    """
+    Returns revenue and sold room nights for every day, week or month of a date range.
+    Please provide start_date and end_date (excluded), and optionally group_by (day, week or month) and by_category=true.
+    """
+    def format_row(self, row, by_category):
+        result = {"period": row["period"]}
+        if by_category:
+            result["category"] = row["category"]
+        result["room_nights"] = row["occupied"]
+        result["revenue"] = row["revenue"]
+        return result
+
+
+### Quote API ###
+
+MAX_QUOTES = 1000
+
+class Quote(GenericAPIView):
+    """
+    Prices many stays in one call without booking them.
+    Please provide stays as a list of objects with start_date, end_date and room_ids,
+    and/or date_ranges (objects with start_date and end_date) and room_sets (room IDs) to price every combination of them.
+    Every quote tells also if all its rooms are free for the stay.
+    """
+    queryset = Room.objects.all()
+    serializer_class = RoomSerializer
+
+    def post(self, request, format=None):
+        data = request.data
+        try:
+            stays = [(stay["start_date"], stay["end_date"], stay["room_ids"]) for stay in data.get("stays", [])]
+            stays += [
+                (date_range["start_date"], date_range["end_date"], room_ids)
+                for date_range in data.get("date_ranges", []) for room_ids in data.get("room_sets", [])
+            ]
+        except (AttributeError, KeyError, TypeError) as err:
+            return Response("Incorrect parameters: " + str(err), status=status.HTTP_400_BAD_REQUEST)
+        if not stays:
+            return Response("No stays to quote", status=status.HTTP_400_BAD_REQUEST)
+        if len(stays) > MAX_QUOTES:
+            return Response("Too many stays, the limit is {}".format(MAX_QUOTES), status=status.HTTP_400_BAD_REQUEST)
+
+        parsed_stays = []
+        for number, (start_date, end_date, room_ids) in enumerate(stays, 1):
+            try:
+                start_date, end_date = parse_date(start_date), parse_date(end_date)
+                check_stay_length(start_date, end_date)
+                room_ids = parse_room_ids(room_ids)
+            except (TypeError, ValueError) as err:
+                return Response("Incorrect stay {}: {}".format(number, err), status=status.HTTP_400_BAD_REQUEST)
+            if end_date <= start_date:
+                return Response("Incorrect stay {}: incorrect date range".format(number), status=status.HTTP_400_BAD_REQUEST)
+            parsed_stays.append((start_date, end_date, room_ids))
+
+        # rooms of all stays are fetched with a single query
+        rooms = Room.objects.in_bulk(set(room_id for start_date, end_date, room_ids in parsed_stays for room_id in room_ids))
+        missing_room_ids = sorted(set(room_id for start_date, end_date, room_ids in parsed_stays for room_id in room_ids if room_id not in rooms))
+        if missing_room_ids:
+            return Response("Rooms do not exist: " + ", ".join(str(room_id) for room_id in missing_room_ids), status=status.HTTP_400_BAD_REQUEST)
+        stays = [([rooms[room_id] for room_id in room_ids], start_date, end_date) for start_date, end_date, room_ids in parsed_stays]
+
+        engine = QuoteEngine.for_stays(stays)
+        room_index = get_room_index()
+        quotes = [{
+            "start_date": start_date,
+            "end_date": end_date,
+            "room_ids": [room.id for room in stay_rooms],
+            "nights": (end_date - start_date).days,
+            "cost": engine.quote(stay_rooms, start_date, end_date),
+            "available": all(room_index.is_available(room.id, start_date, end_date) for room in stay_rooms)
+        } for stay_rooms, start_date, end_date in stays]
+        return Response({"quotes": quotes}, status=status.HTTP_200_OK)
+
+
+### Metrics API ###
+
+class Metrics(APIView):
+    """
+    Returns request metrics of the serving process in the Prometheus text format.
+    """
+    def get(self, request, format=None):
+        booking_cache_stats = get_booking_cache_stats()
+        counters = [
+            ('booking_cache_hits_total', 'Hits of the booking cache', booking_cache_stats['hits']),
+            ('booking_cache_misses_total', 'Misses of the booking cache', booking_cache_stats['misses']),
+        ]
+        return HttpResponse(request_metrics.render(counters), content_type='text/plain; version=0.0.4; charset=utf-8')